@@ -13,10 +13,9 @@ import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning) 
 
 import os
+import re
 import sys
 import argparse
-import subprocess
-import pkg_resources
  
 #%% Define paths for directories
 WORKING_DIRECTORY = "canvar"
@@ -26,24 +25,230 @@ OUTPUT_ANNOTATED_DIRECTORY = "output_files_annotated"
 CLINVAR_DATABASE_DIRECTORY = "clinvar_database_files"
 
 #%% Define variables for links 
-LINK_INTERNET = "https://ftp.ncbi.nlm.nih.gov/pub/clinvar/vcf_GRCh37/" 
-ASSEMBLY = "https://ftp.ncbi.nlm.nih.gov/pub/clinvar/vcf_GRCh"
+CLINVAR_URL = "https://ftp.ncbi.nlm.nih.gov/pub/clinvar/"
+ASSEMBLY = CLINVAR_URL + "vcf_GRCh"
 ARCHIVE_VER = "archive_2.0/"
 
+#%% Define constants for downloads
+DOWNLOAD_BLOCK = 1 << 20
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+LISTING_INDEX = ".listing_index.json"
+LISTING_TTL = 6 * 3600
+
+#%% Define constants for the annotation file
+VCF_DTYPES = {'#CHROM': str, 'POS': int, 'ID': str, 'REF': str, 'ALT': str,
+              'QUAL': str, 'FILTER': str, 'INFO': str}
+ANNOTATION_COLUMNS = ["Identifier", "Gene_symbol", "Clinical_significance", "RS_id", "Mutation_type", "ClinVar_review_status", "ClinVar_disease_name"]
+CATEGORY_COLUMNS = ["Gene_symbol", "Clinical_significance", "Mutation_type", "ClinVar_review_status", "ClinVar_disease_name"]
+VALID_FILE_IDENTIFIER = "0:000000:Valid:File"
+CHUNKSIZE = 250000
+PARTITION_SIZE = 50000
+
+#%% Define constants for the annotation store
+STORE_EXTENSION = ".store"
+STORE_FORMAT = 3
+
+#%% Define constants for the build cache
+CACHE_DIRECTORY = ".cache"
+CACHE_MAX_SIZE_GB = 20
+PARSER_VERSION = 1
+
+#%% Define constants for the annotation service
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_FILE = ".canvar_serve.json"
+
+#%% Define constants for the watch folder
+WATCH_JOURNAL = ".canvar_watch_journal.jsonl"
+WATCH_INTERVAL = 2
+WATCH_SETTLE = 5
+
+#%% Define constants for profiling
+PROFILE_FILE = "canvar_profile_{command}_{timestamp}.json"
+
+#%% Define constants for the benchmark
+BENCHMARK_VARIANTS = 100000
+BENCHMARK_ROWS = 10000
+BENCHMARK_FORMATS = "tsv,csv,xlsx"
+BENCHMARK_HIT_RATE = 0.7
+BENCHMARK_EXCEL_ENGINES = "pandas,stream"
+STARTUP_RUNS = 5
+STARTUP_BUDGETS = {"--help": 0.15, "annotate": 1.5}
+BENCHMARK_STARTUP_FILE = "benchmark_startup.tsv"
+
 #%% Define constants for package requirements
 REQUIRED_PACKAGES = {"regex == 2022.3.15", 
                      "numpy == 1.24.4", 
                      "pandas == 1.4.2", 
-                     "alive-progress == 1.6.2", 
                      "tabulate == 0.8.9", 
                      "requests == 2.27.1", 
-                     "wget == 3.2",
                      "openpyxl == 3.1.2"}
+
+#%% Function to profile runs
+# With --profile, each stage of check_construct and annotate is timed and a JSON report is written when the command ends. 
+# A stage is recorded with its wall time, rows, rows/sec and peak memory use (RSS). Stages are not nested.
+
+# Profiler of the run (set by run_profiled); None when the run is not profiled.
+_PROFILE = None
+
+# Helper function to get the peak memory use (RSS, in MB) of this process. 
+# On Linux the peak can be reset, so each stage gets its own peak; elsewhere it is the peak of the process so far.
+def peak_rss_mb(reset=False):
+    
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+# Class to collect the stages of a profiled run and write the report.
+class Profiler:
+    
+    def __init__(self, command):
+        
+        import time
+        
+        self.command = command
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.start = time.perf_counter()
+        self.stages = []
+        self.peak = peak_rss_mb() or 0.0
+    
+    def begin(self):
+        
+        self.peak = max(self.peak, peak_rss_mb() or 0.0)
+        peak_rss_mb(reset=True)
+    
+    def end(self, record, seconds, rows):
+        
+        peak = peak_rss_mb()
+        self.peak = max(self.peak, peak or 0.0)
+        
+        record["seconds"] = round(seconds, 6)
+        if rows is not None:
+            record["rows"] = int(rows)
+            record["rows_per_sec"] = round(rows / seconds, 1) if seconds > 0 else None
+        record["peak_rss_mb"] = None if peak is None else round(peak, 1)
+        record["pid"] = os.getpid()
+        self.stages.append(record)
+    
+    def summary(self):
+        
+        summary = {}
+        for record in self.stages:
+            total = summary.setdefault(record["stage"], {"calls": 0, "seconds": 0.0, "rows": None, "peak_rss_mb": 0.0})
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            if "rows" in record:
+                total["rows"] = (total["rows"] or 0) + record["rows"]
+            total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"] or 0.0)
+        for total in summary.values():
+            total["seconds"] = round(total["seconds"], 6)
+            total["rows_per_sec"] = round(total["rows"] / total["seconds"], 1) if total["rows"] and total["seconds"] > 0 else None
+        
+        return summary
+    
+    def report(self, status):
+        
+        import platform
+        import time
+        
+        versions = {"python": platform.python_version()}
+        for package in ("pandas", "numpy", "openpyxl"):
+            if package in sys.modules:
+                versions[package] = getattr(sys.modules[package], "__version__", None)
+        
+        return {"command": self.command,
+                "arguments": sys.argv[1:],
+                "started": self.started,
+                "status": status,
+                "wall_time_sec": round(time.perf_counter() - self.start, 6),
+                "peak_rss_mb": round(max(self.peak, peak_rss_mb() or 0.0), 1),
+                "versions": versions,
+                "summary": self.summary(),
+                "stages": self.stages}
+
+# Class to time one stage of a profiled run: with ProfileStage("read", file=a) as stage: ... stage.rows = len(table)
+# Does nothing when the run is not profiled.
+class ProfileStage:
+    
+    def __init__(self, name, rows=None, **info):
+        
+        self.record = {"stage": name, **info}
+        self.rows = rows
+    
+    def __enter__(self):
+        
+        import time
+        
+        if _PROFILE is not None:
+            _PROFILE.begin()
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        
+        import time
+        
+        if _PROFILE is not None:
+            _PROFILE.end(self.record, time.perf_counter() - self.start, self.rows)
+        return False
+
+# Function to run a command with --profile and write its JSON report (PROFILE_FILE) to the directory the command was started from.
+def run_profiled(args):
+    
+    import json
+    import time
+    
+    global _PROFILE
+    
+    command = args.func.__name__
+    report_file = os.path.join(os.getcwd(), PROFILE_FILE.format(command=command, timestamp=time.strftime("%Y%m%d_%H%M%S")))
+    _PROFILE = Profiler(command)
+    
+    status = "failed"
+    try:
+        args.func(args)
+        status = "ok"
+    except SystemExit as e:
+        status = "ok" if not e.code else "failed"
+        raise
+    finally:
+        with open(report_file, "w") as f:
+            json.dump(_PROFILE.report(status), f, indent=2)
+        print(f"Profile report saved as {report_file}")
+        _PROFILE = None
     
 #%% Function to install required packages
 def import_packages(args):
     
-    missing_packages = REQUIRED_PACKAGES - {pkg.key for pkg in pkg_resources.working_set}
+    import subprocess
+    from importlib import metadata
+    
+    # Packages that are not installed, or not in the required version, are installed.
+    missing_packages = set()
+    for package in REQUIRED_PACKAGES:
+        name, version = [p.strip() for p in package.split("==")]
+        try:
+            if metadata.version(name) != version:
+                missing_packages.add(package)
+        except metadata.PackageNotFoundError:
+            missing_packages.add(package)
+    
     if args.import_packages == "Y":
         for package in missing_packages:
             print(f"installing... {package}")
@@ -57,14 +262,10 @@ def import_packages(args):
 # Helper function to create or validate a directory
 def create_or_validate_directory(directory):
     
-    import time
-    
     if not os.path.exists(directory):
         os.mkdir(directory)
-        time.sleep(1)
         print(f"Subdirectory: {directory} ...created")
     else:
-        time.sleep(1)
         print(f"Subdirectory: {directory} ...up-to-date") 
 
 # Function to create directories        
@@ -105,183 +306,748 @@ def clinvar_table_data(clinvar_db_file):
     
     return clinvar_db_file_df
 
-#%% Function to check internet access.
-def check_internet_connection():
+#%% Functions to download a file
+# Files are downloaded into <file>.part and moved to <file> once complete and verified against the md5 checksum NCBI publishes with it (<file>.md5). 
+# With HTTP Range requests, the file can be downloaded in parallel segments over one pooled session, and a dropped download is resumed where it stopped (<file>.part.json keeps the progress).
+
+# Helper function to create a requests session with a connection pool for the download segments.
+def download_session(segments=1):
+    
     import requests
-    try: 
-        resp = requests.get(LINK_INTERNET, timeout=5)
-        return True
-    except requests.ConnectionError:
-        return False
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(segments, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    
+    return session
 
-# Function to download files. 
-def download_db(args):
-    	
-    if not check_internet_connection():
-        print("Internet connection is required for packages and download_db to run")
+# Helper function to get the md5 checksum published with a file (<url>.md5). None when there is none.
+def remote_md5(session, url):
+    
+    r = session.get(url + ".md5", timeout=DOWNLOAD_TIMEOUT)
+    if r.status_code != 200:
+        return None
+    checksum = re.search(r"\b[0-9a-fA-F]{32}\b", r.text)
+    
+    return checksum.group(0).lower() if checksum else None
 
-    import re
-    import wget
-    import os
+# Helper function to get the md5 checksum of a file.
+def file_md5(file):
     
-    os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
-        
-    l_file = args.latest_file
+    import hashlib
     
-    if l_file == "latest":
-        which_assembly = input("Specify Genome Reference Consortium Human assembly [37/38]: ")
-        link = ASSEMBLY + f"{which_assembly}/"
-        
-        print("Searching for latest database file at link...")
-        
-        import requests
-        r = requests.get(link)
-        r.close()
+    checksum = hashlib.md5()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BLOCK), b""):
+            checksum.update(block)
+    
+    return checksum.hexdigest()
 
-        content = r.text
-        clinvar_files = re.findall(r"(?<=href=).*?(?=\n<a)", content)
+# Helper function to download one segment [start, position, end] of a file into the partial file, from its position. 
+# The position is updated while writing, so the segment can be resumed; dropped connections are retried from the position.
+def download_segment(session, url, part_file, segment, validator, progress):
+    
+    import time
+    import requests
+    
+    start, _, end = segment
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        headers = {}
+        if end is not None:
+            headers["Range"] = f"bytes={segment[1]}-{end - 1}"
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    # The whole file is sent, so it is written from the start (only possible for the first segment).
+                    if start != 0:
+                        raise ValueError("The server does not support HTTP Range requests - download with --segments 1.")
+                    progress(-segment[1])
+                    segment[1] = 0
+                with open(part_file, "r+b") as f:
+                    f.seek(segment[1])
+                    for block in r.iter_content(DOWNLOAD_BLOCK):
+                        if end is not None:
+                            block = block[:end - segment[1]]
+                        f.write(block)
+                        segment[1] += len(block)
+                        progress(len(block))
+                        if end is not None and segment[1] >= end:
+                            break
+            if end is None or segment[1] >= end:
+                return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            print(f"\nConnection dropped ({type(e).__name__}) - resuming at byte {segment[1]}...")
+            time.sleep(min(2 ** attempt, 30))
+    
+    raise ValueError(f"Download of {url} stopped at byte {segment[1]} of {end}.")
 
-        str_database = []
-        for clin_f in clinvar_files[0:]:
-            if clin_f.startswith('"clinvar') and '.vcf.gz"' in clin_f:
-                str_database.append(clin_f)
-        
-        clinvar_files_df = clinvar_table_data(str_database)
-        
-        
-        if not clinvar_files_df.empty:
-            print("Latest files available at:")
-            tab_print(clinvar_df=clinvar_files_df, option=False)
+# Function to download a file (atomically, resumable and md5 verified) into file_name. Gives False when the file was already downloaded.
+def download_file(url, file_name, segments=1, session=None):
+    
+    import json
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    session = session or download_session(segments)
+    part_file = file_name + ".part"
+    state_file = part_file + ".json"
+    
+    head = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length") or 0) or None
+    ranges = size is not None and head.headers.get("Accept-Ranges", "").lower() == "bytes"
+    validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+    
+    md5 = remote_md5(session, url)
+    if os.path.exists(file_name) and md5 is not None and os.path.getsize(file_name) == size and file_md5(file_name) == md5:
+        print(f"{file_name} is already downloaded (md5 verified).")
+        return False
+    
+    # Resume a partial download of the same file (same size and ETag/Last-Modified).
+    state = None
+    if ranges and os.path.exists(state_file) and os.path.exists(part_file):
+        with open(state_file) as f:
+            state = json.load(f)
+        if (state["url"], state["size"], state["validator"]) != (url, size, validator):
+            state = None
+    
+    if state is None:
+        n_segments = max(1, min(segments, size // DOWNLOAD_BLOCK + 1)) if ranges else 1
+        bounds = [round(size * n / n_segments) for n in range(n_segments + 1)] if ranges else [0, size]
+        state = {"url": url, "size": size, "validator": validator,
+                 "segments": [[bounds[n], bounds[n], bounds[n + 1]] for n in range(n_segments)]}
+        with open(part_file, "wb") as f:
+            if size:
+                f.truncate(size)
+    
+    done = sum(segment[1] - segment[0] for segment in state["segments"])
+    if done:
+        print(f"Resuming download at {done / 1e6:.1f} MB...")
+    
+    lock = threading.Lock()
+    last = [0.0, 0.0]
+    
+    def save_state():
+        if ranges:
+            with open(state_file + ".tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(state_file + ".tmp", state_file)
+    
+    def progress(n_bytes):
+        nonlocal done
+        with lock:
+            done += n_bytes
+            now = time.perf_counter()
+            if now - last[0] >= 0.5:
+                last[0] = now
+                save_state()
+                total = f" / {size / 1e6:.1f} MB ({100 * done / size:.0f}%)" if size else " MB"
+                print(f"\r{done / 1e6:.1f}{total}", end="", flush=True)
+    
+    pending = [segment for segment in state["segments"] if segment[2] is None or segment[1] < segment[2]]
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as executor:
+            futures = [executor.submit(download_segment, session, url, part_file, segment, validator if ranges else None, progress) for segment in pending]
+            for future in futures:
+                future.result()
+    finally:
+        with lock:
+            save_state()
+    print(f"\r{done / 1e6:.1f} MB downloaded" + 20 * " ")
+    
+    if size is not None and os.path.getsize(part_file) != size:
+        raise ValueError(f"Downloaded file has {os.path.getsize(part_file)} bytes, expected {size}.")
+    
+    if md5 is None:
+        print(f"No md5 checksum found at {url}.md5 - the file is not verified.")
+    else:
+        if file_md5(part_file) != md5:
+            os.remove(part_file)
+            if os.path.exists(state_file):
+                os.remove(state_file)
+            raise ValueError(f"md5 checksum of the downloaded file does not match {url}.md5 - the download was removed.")
+        print("md5 checksum verified.")
+    
+    os.replace(part_file, file_name)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    
+    return True
+
+# Helper function to download a ClinVar database file for download_db.
+def download_clinvar_file(download_url, chosen_file, args, session=None):
+    
+    import requests
+    
+    print(f"Downloading {chosen_file}...")
+    try:
+        downloaded = download_file(download_url, chosen_file, segments=args.segments, session=session)
+    except (requests.RequestException, ValueError, OSError) as e:
+        print(f"\nDownload of {chosen_file} failed: {e}")
+        print("Rerun download_db to resume (or restart) the download.")
+        sys.exit(1)
+    if downloaded:
+        print(f"{chosen_file} has been downloaded and placed in {CLINVAR_DATABASE_DIRECTORY}")
 
-            download = input("Download the latest file? [Y/N]: ")
+#%% Function to index ClinVar directory listings
+# The parsed listings of the ClinVar FTP (latest files and archive years) are kept in ./clinvar_database_files/.listing_index.json. 
+# A listing younger than LISTING_TTL is used without a request; an older one is revalidated with a conditional request (ETag/If-Modified-Since).
 
-            if download.startswith("Y"):
-                chosen_file = clinvar_files_df.iloc[0]["Name"]
-                download_url = link + chosen_file
-                print(f"Downloading {chosen_file}...")
-                wget.download(download_url)
-                print(f"\n{chosen_file} has been downloaded and placed in {CLINVAR_DATABASE_DIRECTORY}")
-            else:
-                print("No file downloaded.")
+# Helper function to parse the database files (.vcf.gz) of a ClinVar directory listing.
+def parse_clinvar_listing(content):
+    
+    clinvar_files = re.findall(r"(?<=href=).*?(?=\n<a)", content)
+    
+    str_database = []
+    for clin_f in clinvar_files[0:]:
+        if clin_f.startswith('"clinvar') and '.vcf.gz"' in clin_f:
+            str_database.append(clin_f)
+    
+    return clinvar_table_data(str_database)
+
+# Helper function to get the database files of a ClinVar directory listing, from the listing index when it is up-to-date.
+def clinvar_listing(session, url, refresh=False):
+    
+    import json
+    import time
+    import pandas as pd
+    
+    index = {}
+    if os.path.exists(LISTING_INDEX):
+        try:
+            with open(LISTING_INDEX) as f:
+                index = json.load(f)
+        except ValueError:
+            index = {}
+    
+    entry = index.get(url)
+    now = time.time()
+    if entry is not None and not refresh and now - entry["checked"] < LISTING_TTL:
+        return pd.DataFrame(entry["files"], columns=["Name", "Date", "Size"])
+    
+    headers = {}
+    if entry is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    
+    r = session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    r.close()
+    
+    if r.status_code == 304 and entry is not None:
+        entry["checked"] = now
+    else:
+        if r.status_code == 404:
+            files = []
         else:
-            print("No suitable database files found.")
-    else: 
-        which_assembly = input("Which Genome Reference Consortium Human Build? [37/38]: ")
-        link_archive = ASSEMBLY + f"{which_assembly}/" + ARCHIVE_VER
-        a_file = args.archive_file
-        a_file = str(a_file)
+            r.raise_for_status()
+            files = parse_clinvar_listing(r.text).values.tolist()
+        entry = {"files": files,
+                 "etag": r.headers.get("ETag"),
+                 "last_modified": r.headers.get("Last-Modified"),
+                 "checked": now}
     
-        print(f"Searching ClinVar for database files from {a_file}...\n")
+    index[url] = entry
+    with open(LISTING_INDEX + ".tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(LISTING_INDEX + ".tmp", LISTING_INDEX)
     
-        archive_url = link_archive + a_file + "/"
-     
-        import requests
+    return pd.DataFrame(entry["files"], columns=["Name", "Date", "Size"])
 
-        r = requests.get(archive_url)
-        r.close()
+# Helper function to select a database file for download_db --select: latest, a date (YYYYMMDD) or an index of the listing. Gives None when there is no such file.
+def select_clinvar_file(clinvar_files_df, select):
+    
+    if clinvar_files_df.empty:
+        return None
+    
+    if select == "latest":
+        return clinvar_files_df["Name"].max()
+    
+    if len(select) == 8 and select.isdigit():
+        chosen = clinvar_files_df.loc[clinvar_files_df["Name"] == f"clinvar_{select}.vcf.gz", "Name"]
+        return chosen.iloc[0] if not chosen.empty else None
+    
+    try:
+        choose_file = int(select)
+    except ValueError:
+        return None
+    if choose_file >= 0 and choose_file < len(clinvar_files_df):
+        return clinvar_files_df.iloc[choose_file]["Name"]
+    
+    return None
 
-        content = r.text
-        arc_files = re.findall(r"(?<=href=).*?(?=\n<a)", content)
+# Function to download files. 
+def download_db(args):
 
-        arc_database = []
-        for arc_f in arc_files[0:]:
-            if arc_f.startswith('"clinvar') and '.vcf.gz"' in arc_f:
-                arc_database.append(arc_f)
-        
-        arc_files_df = clinvar_table_data(arc_database)
+    import os
+    import requests
+    
+    os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
         
-        if not arc_files_df.empty:
-            print(f"Archive files available for year {a_file}:\n")
-            tab_print(clinvar_df=arc_files_df, option=True)
+    l_file = args.latest_file
+    select = args.select
+    assembly_url = ASSEMBLY.replace(CLINVAR_URL, args.mirror.rstrip("/") + "/") if args.mirror else ASSEMBLY
+    session = download_session(args.segments)
     
-            choose_file = input("Select file to download (by index): ")
+    # --select latest without a year (-a) downloads from the latest files.
+    if l_file is None and args.archive_file is None and select == "latest":
+        l_file = "latest"
     
-            try:
-                choose_file = int(choose_file)
-                if choose_file >= 0 and choose_file < len(arc_files_df):
-                    chosen_file = arc_files_df.iloc[choose_file]["Name"]
-                    download_url = archive_url + chosen_file
-                    print(f"Downloading {chosen_file}...")
-                    wget.download(download_url)
-                    print(f"\n{chosen_file} has been downloaded and placed in {CLINVAR_DATABASE_DIRECTORY}")
+    try:
+        if l_file == "latest":
+            which_assembly = args.assembly or input("Specify Genome Reference Consortium Human assembly [37/38]: ")
+            link = assembly_url + f"{which_assembly}/"
+            
+            print("Searching for latest database file at link...")
+            
+            clinvar_files_df = clinvar_listing(session, link, refresh=args.refresh)
+            
+            if not clinvar_files_df.empty:
+                print("Latest files available at:")
+                tab_print(clinvar_df=clinvar_files_df, option=False)
+    
+                if select is None:
+                    download = input("Download the latest file? [Y/N]: ")
+                    chosen_file = clinvar_files_df.iloc[0]["Name"] if download.startswith("Y") else None
                 else:
+                    chosen_file = select_clinvar_file(clinvar_files_df, select)
+                
+                if chosen_file is not None:
+                    download_url = link + chosen_file
+                    download_clinvar_file(download_url, chosen_file, args, session)
+                elif select is not None:
+                    print(f"No database file matching '{select}'. No file downloaded.")
+                    sys.exit(1)
+                else:
+                    print("No file downloaded.")
+            else:
+                print("No suitable database files found.")
+                if select is not None:
+                    sys.exit(1)
+        else: 
+            which_assembly = args.assembly or input("Which Genome Reference Consortium Human Build? [37/38]: ")
+            link_archive = assembly_url + f"{which_assembly}/" + ARCHIVE_VER
+            a_file = args.archive_file
+            if a_file is None and select is not None and len(select) == 8 and select.isdigit():
+                a_file = select[:4]
+            if a_file is None:
+                print("Specify the year to search the archive with (-a), or download the latest file with -l latest. No file downloaded.")
+                sys.exit(1)
+            a_file = str(a_file)
+        
+            print(f"Searching ClinVar for database files from {a_file}...\n")
+        
+            archive_url = link_archive + a_file + "/"
+    
+            arc_files_df = clinvar_listing(session, archive_url, refresh=args.refresh)
+            
+            if not arc_files_df.empty:
+                print(f"Archive files available for year {a_file}:\n")
+                tab_print(clinvar_df=arc_files_df, option=True)
+        
+                if select is None:
+                    select = input("Select file to download (by index): ")
+                    if not select.strip().isdigit():
+                        print("Invalid input. No file downloaded.")
+                        return
+                chosen_file = select_clinvar_file(arc_files_df, select.strip())
+                
+                if chosen_file is not None:
+                    download_url = archive_url + chosen_file
+                    download_clinvar_file(download_url, chosen_file, args, session)
+                elif select.strip().isdigit() and len(select.strip()) != 8:
                     print("Invalid index. No file downloaded.")
-            except ValueError:
-                print("Invalid input. No file downloaded.")
-        else:
-            print(f"No suitable archive files found for year {a_file}.")
+                    sys.exit(1)
+                else:
+                    print(f"No database file matching '{select}'. No file downloaded.")
+                    sys.exit(1)
+            else:
+                print(f"No suitable archive files found for year {a_file}.")
+                if select is not None:
+                    sys.exit(1)
+    
+    except requests.ConnectionError:
+        print("Internet connection is required for packages and download_db to run")
+        sys.exit(1)
+    except requests.HTTPError as e:
+        print(f"ClinVar could not be searched: {e}")
+        sys.exit(1)
 
 #%% Function to create file for annotation of variants
-# Helper function to filter ClinVar variants
-def Clinvar_filtering(data_vcf, name):
+# Helper function to find all values following an INFO key. 
+# Reproduces re.findall(r"(?<=KEY).*?(?=;)", info) exactly (including keys found inside other keys or values, e.g. "RS" in "PRSS1"), but with str.find instead of a lookbehind test at every character.
+def info_findall(info, key):
+    
+    n = len(key)
+    
+    # Common case: the key occurs once and is followed by a value.
+    idx = info.find(key)
+    if idx < 0:
+        return []
+    end = info.find(";", idx + n)
+    if end < 0:
+        return []
+    if end > idx + n and info.find(key, end - n) < 0:
+        return [info[idx + n:end]]
+    
+    matches = []
+    pos = 0
+    empty_at = -1
+    
+    while True:
+        idx = info.find(key, pos - n if pos > n else 0)
+        if idx < 0:
+            return matches
+        start = idx + n
+        # After an empty match the regex engine retries the same position and only accepts a non-empty match.
+        end = info.find(";", start + 1 if start == empty_at else start)
+        if end < 0:
+            return matches
+        matches.append(info[start:end])
+        empty_at = end if start == end else -1
+        pos = end
+
+# Helper function to collect the INFO values of one variant in a single pass. 
+# CLNSIG and GENEINFO are searched without an end mark, the remaining keys with a ";" added to the end of the "INFO" column (as the column construction always has). 
+def info_matches(info):
+    
+    info_end = info + ";"
+    
+    return (info_findall(info, "CLNSIG"),
+            info_findall(info, "GENEINFO"),
+            info_findall(info_end, "RS"),
+            info_findall(info_end, "MC"),
+            info_findall(info_end, "CLNREVSTAT"),
+            info_findall(info_end, "CLNDN"))
+
+# Helper function to fingerprint the ClinVar records (CHR, POS, REF, ALT and INFO). 
+# Records with the same fingerprint give the same row in the annotation file, which lets check_construct --previous reuse rows of the previous build.
+def vcf_fingerprints(data_vcf):
     
-    import re
     import pandas as pd
     
+    return pd.util.hash_pandas_object(data_vcf[["CHR", "POS", "REF", "ALT", "INFO"]], index=False).to_numpy()
+
+# Helper function to create the columns of the annotation file from ClinVar variants.
+def Clinvar_columns(data_vcf, print_=print):
+    
+    # All INFO keys are collected in one pass over the column. The columns below are created from the collected values with the same string handling as before, so the annotation file is unchanged.
+    rows = len(data_vcf)
+    print_("Task[1/8] - Parsing column: INFO (CLNSIG, GENEINFO, RS, MC, CLNREVSTAT, CLNDN)")
+    with ProfileStage("Task[1/8] INFO", rows):
+        parsed = [info_matches(x) for x in data_vcf["INFO"]]
+        clnsig, geneinfo, rs, mc, clnrevstat, clndn = list(zip(*parsed)) or [()] * 6
+    
     # Clinical significance
-    print("Task[1/8] - Creating column: Clinical_significance")
-    data_vcf["Clinical_significance"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=CLNSIG).*?(?=;)", x)).astype("str")
-    data_vcf["Clinical_significance"] = [re.sub(r'[^a-zA-Z/.]+', '_', s) for s in data_vcf["Clinical_significance"]]
-    data_vcf["Clinical_significance"] = data_vcf["Clinical_significance"].apply(lambda x: x.rstrip("_")).apply(lambda x: x.lstrip("_")).apply(lambda x: x.replace("_", " "))
+    print_("Task[2/8] - Creating column: Clinical_significance")
+    with ProfileStage("Task[2/8] Clinical_significance", rows):
+        non_letters = re.compile(r'[^a-zA-Z/.]+')
+        data_vcf["Clinical_significance"] = [non_letters.sub("_", str(x)).rstrip("_").lstrip("_").replace("_", " ") for x in clnsig]
 
     # Gene symbol 
-    print("Task[2/8] - Creating column: Gene_symbol ")
-    data_vcf["Gene_symbol"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=GENEINFO).*?(?=;)", x)).astype("str")
-    data_vcf["Gene_symbol"] = data_vcf["Gene_symbol"].apply(lambda x: x.split(":")[0]).apply(lambda x: x.replace("['=", ""))
-
-    # a ";" is added to the end of the "INFO" column to have a end mark. This is needed as re.findall finds "something" inbetween two patterns. a "space" can not be used. 
-    data_vcf["INFO"] = data_vcf["INFO"].apply(lambda x: x+";")
+    print_("Task[3/8] - Creating column: Gene_symbol ")
+    with ProfileStage("Task[3/8] Gene_symbol", rows):
+        data_vcf["Gene_symbol"] = [str(x).split(":")[0].replace("['=", "") for x in geneinfo]
 
     # RS_ids
-    print("Task[3/8] - Creating column: RS_id")
-    data_vcf["RS_id"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=RS).*?(?=;)", x)).astype("str").apply(lambda x: re.sub('[^0-9]',"", x)).astype("str")
-
-    data_vcf["RS_id"] = ["RS"+x if len(x) > 1 else x for x in data_vcf["RS_id"]]
+    print_("Task[4/8] - Creating column: RS_id")
+    with ProfileStage("Task[4/8] RS_id", rows):
+        non_digits = re.compile('[^0-9]')
+        data_vcf["RS_id"] = [non_digits.sub("", str(x)) for x in rs]
+        data_vcf["RS_id"] = ["RS"+x if len(x) > 1 else x for x in data_vcf["RS_id"]]
 
     ## Mutation type of the variant e.g. missense, frameshift etc. 
-    print("Task[4/8] - Creating column: Mutation_type")
-    data_vcf["Mutation_type"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=MC).*?(?=;)", x)).astype("str")
-    data_vcf["Mutation_type"] = data_vcf["Mutation_type"].apply(lambda x: x.split("|")[-1]).apply(lambda x: x[0:-2])
+    print_("Task[5/8] - Creating column: Mutation_type")
+    with ProfileStage("Task[5/8] Mutation_type", rows):
+        data_vcf["Mutation_type"] = [str(x).split("|")[-1][0:-2] for x in mc]
         
-    ## ClinVar review status
-    print("Task[5/8] - Creating column: ClinVar_review_status")
-    data_vcf["ClinVar_review_status"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=CLNREVSTAT).*?(?=;)", x)).astype("str")
-    data_vcf["ClinVar_review_status"] = data_vcf["ClinVar_review_status"].apply(lambda x: x.replace("['=", "")).apply(lambda x: x.replace("']", ""))
-    
-    ## Disease associations
-    print("Task[6/8] - Creating column: ClinVar_disease_name")
-    data_vcf["ClinVar_disease_name"] = data_vcf["INFO"].apply(lambda x: re.findall(r"(?<=CLNDN).*?(?=;)", x)).astype("str")
-    data_vcf["ClinVar_disease_name"] = data_vcf["ClinVar_disease_name"].apply(lambda x: x.replace("['=", "")).apply(lambda x: x.replace("']", ""))        
+    ## ClinVar review status and disease associations
+    print_("Task[6/8] - Creating columns: ClinVar_review_status, ClinVar_disease_name")
+    with ProfileStage("Task[6/8] ClinVar_review_status, ClinVar_disease_name", rows):
+        data_vcf["ClinVar_review_status"] = [str(x).replace("['=", "").replace("']", "") for x in clnrevstat]
+        data_vcf["ClinVar_disease_name"] = [str(x).replace("['=", "").replace("']", "") for x in clndn]
 
     ## Identifier is a created ID for the variant. It contains build from 4 columns; CHR:POS:REF:ALT. The intention with this column is to use it as a column to merge variants on from once own dataset. 
-    print("Task[7/8] - Creating column: Identifier")
-    data_vcf["POS"] = data_vcf["POS"].astype("str")
-    data_vcf["Identifier"] = data_vcf["CHR"] +":"+ data_vcf["POS"] +":"+ data_vcf["REF"] +":"+ data_vcf["ALT"]
+    print_("Task[7/8] - Creating column: Identifier")
+    with ProfileStage("Task[7/8] Identifier", rows):
+        data_vcf["POS"] = data_vcf["POS"].astype("str")
+        data_vcf["Identifier"] = data_vcf["CHR"] +":"+ data_vcf["POS"] +":"+ data_vcf["REF"] +":"+ data_vcf["ALT"]
+    
+    return data_vcf[ANNOTATION_COLUMNS]
+
+# Helper function to filter ClinVar variants
+# With mode="a" the variants are appended to an annotation file under construction, and valid_file=False leaves out the validation identifier (see append_valid_file).
+# With a previous annotation store (check_construct --previous), variants whose record is unchanged are copied from it and only new or changed variants are filtered.
+# Gives the fingerprints of the variants (see vcf_fingerprints).
+def Clinvar_filtering(data_vcf, name, mode="w", valid_file=True, verbose=True, previous=None):
+    
+    import numpy as np
+    import pandas as pd
+    
+    print_ = print if verbose else (lambda *args: None)
+    
+    with ProfileStage("Fingerprints", len(data_vcf)):
+        fingerprints = vcf_fingerprints(data_vcf)
+    
+    if previous is None:
+        ClinVar_final = Clinvar_columns(data_vcf, print_)
+    else:
+        with ProfileStage("Reuse previous build", len(data_vcf)):
+            identifiers = (data_vcf["CHR"] +":"+ data_vcf["POS"].astype("str") +":"+ data_vcf["REF"] +":"+ data_vcf["ALT"]).to_numpy()
+            reused, entries = previous.match_fingerprints(fingerprints, identifiers)
+        print(f"Reusing {reused.sum()} unchanged variants from {previous.meta['source']} - filtering {(~reused).sum()} new or changed variants")
+        
+        rows = np.empty((len(data_vcf), len(ANNOTATION_COLUMNS)), dtype=object)
+        rows[reused] = previous.decode(entries, raw=True).to_numpy()
+        rows[~reused] = Clinvar_columns(data_vcf[~reused].copy(), print_).to_numpy()
+        ClinVar_final = pd.DataFrame(rows, columns=ANNOTATION_COLUMNS)
         
     # Saving file    
-    print(f"Task[8/8] - Saving file into ./{CLINVAR_DATABASE_DIRECTORY}")
-    ClinVar_final = data_vcf.copy()
+    print_(f"Task[8/8] - Saving file into ./{CLINVAR_DATABASE_DIRECTORY}")
+    
+    with ProfileStage("Task[8/8] Saving", len(ClinVar_final)):
+        # Adding identifier for validation of file    
+        if valid_file:
+            V_data = {"Identifier": [VALID_FILE_IDENTIFIER]}
+            Valid_file = pd.DataFrame(V_data)
+            ClinVar_final = pd.concat([ClinVar_final, Valid_file], ignore_index=True)
+        
+        ClinVar_final.to_csv(name, index=False, sep="\t", mode=mode, header=(mode == "w"))
+    
+    if valid_file:
+        print("\nAnnotation file created!")
+    
+    return fingerprints
+
+# Helper function to add the identifier for validation to the end of an annotation file. 
+# Used when the annotation file is written in chunks, so annotate only accepts files that were completed.
+def append_valid_file(name, mode="a"):
+    
+    import pandas as pd
+    
+    Valid_file = pd.DataFrame({"Identifier": [VALID_FILE_IDENTIFIER]}, columns=ANNOTATION_COLUMNS)
+    Valid_file.to_csv(name, index=False, sep="\t", mode=mode, header=(mode == "w"))
+    
+    print("\nAnnotation file created!")
+
+# Helper function to read a ClinVar database file (.vcf or .vcf.gz) in chunks of variants. 
+# The "##" meta lines are skipped while reading, and gzipped files are decompressed on the fly, so only one chunk is held in memory.
+def read_vcf_chunks(file, chunksize):
+    
+    import gzip
+    import pandas as pd
+    from pandas.errors import EmptyDataError
+    
+    opener = gzip.open if file.endswith(".gz") else open
+    
+    with opener(file, "rt") as f:
+        line = f.readline()
+        while line.startswith("##"):
+            line = f.readline()
+        names = line.rstrip("\r\n").split("\t")
         
-    order_columns = ["Identifier", "Gene_symbol", "Clinical_significance", "RS_id", "Mutation_type", "ClinVar_review_status", "ClinVar_disease_name"]
+        try:
+            reader = pd.read_csv(f, sep="\t", header=None, names=names, dtype=VCF_DTYPES, chunksize=chunksize)
+            for chunk in reader:
+                yield chunk.rename(columns={'#CHROM': 'CHR'})
+        except EmptyDataError:
+            return
+
+# Helper function to create the annotation file chunk by chunk from a ClinVar database file.
+# Gives the fingerprints of the variants (see vcf_fingerprints).
+def Clinvar_streaming(db_file, name, chunksize, previous=None):
+    
+    import itertools
+    import numpy as np
+    
+    mode = "w"
+    n_variants = 0
+    fingerprints = []
+    
+    chunks = read_vcf_chunks(db_file, chunksize)
+    for n_chunk in itertools.count(start=1):
+        with ProfileStage("Read", chunk=n_chunk) as stage:
+            data_vcf = next(chunks, None)
+            stage.rows = 0 if data_vcf is None else len(data_vcf)
+        if data_vcf is None:
+            break
+        print(f"Chunk {n_chunk} - variants {n_variants + 1}-{n_variants + len(data_vcf)}")
+        fingerprints.append(Clinvar_filtering(data_vcf=data_vcf, name=name, mode=mode, valid_file=False, verbose=(mode == "w"), previous=previous))
+        n_variants += len(data_vcf)
+        mode = "a"
+    
+    append_valid_file(name, mode=mode)
+    
+    return np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint64)
+
+# Helper function to read the variants of a ClinVar database file (.vcf or .vcf.gz) as text partitions of n_lines lines for check_construct --workers. 
+# Gives the column names first, then the partitions in the order of the file.
+def vcf_text_partitions(file, n_lines):
+    
+    import gzip
+    import itertools
+    
+    opener = gzip.open if file.endswith(".gz") else open
+    
+    with opener(file, "rt") as f:
+        line = f.readline()
+        while line.startswith("##"):
+            line = f.readline()
+        yield line.rstrip("\r\n").split("\t")
         
+        while True:
+            with ProfileStage("Read partition") as stage:
+                lines = list(itertools.islice(f, n_lines))
+                stage.rows = len(lines)
+            if not lines:
+                return
+            yield "".join(lines)
+
+# Previous annotation store of the worker processes of check_construct --workers (set by _init_filter_worker).
+_PREVIOUS = None
+
+# Helper function to set up a worker process of check_construct --workers.
+def _init_filter_worker(previous_store, profile=False):
+    
+    global _PREVIOUS, _PROFILE
+    if profile:
+        _PROFILE = Profiler("check_construct")
+    _PREVIOUS = AnnotationStore(previous_store) if previous_store else None
+
+# Helper function to filter one partition of variants in a worker process of check_construct --workers. 
+# Gives the rows of the annotation file as text (with the header for the first partition), the fingerprints of the variants and the profiled stages.
+def _filter_partition(names, text, mode):
+    
+    import io
+    import pandas as pd
+    
+    n_stages = len(_PROFILE.stages) if _PROFILE is not None else 0
+    
+    with ProfileStage("Read") as stage:
+        data_vcf = pd.read_csv(io.StringIO(text), sep="\t", header=None, names=names, dtype=VCF_DTYPES).rename(columns={'#CHROM': 'CHR'})
+        stage.rows = len(data_vcf)
+    
+    rows = io.StringIO()
+    fingerprints = Clinvar_filtering(data_vcf=data_vcf, name=rows, mode=mode, valid_file=False, verbose=False, previous=_PREVIOUS)
+    
+    return rows.getvalue(), fingerprints, len(data_vcf), (_PROFILE.stages[n_stages:] if _PROFILE is not None else [])
 
-    ClinVar_final = ClinVar_final[order_columns]
+# Helper function to create the annotation file from a ClinVar database file with a pool of worker processes. 
+# The file is split into partitions of n_lines variants that are filtered in parallel, and written in the order of the file, so the annotation file is the same as with one process.
+# Gives the fingerprints of the variants (see vcf_fingerprints).
+def Clinvar_parallel(db_file, name, workers, n_lines, previous=None):
+    
+    import collections
+    import multiprocessing
+    import numpy as np
+    
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    previous_store = os.path.abspath(previous.path) if previous is not None else None
+    pool = multiprocessing.get_context(method).Pool(workers, initializer=_init_filter_worker, initargs=(previous_store, _PROFILE is not None))
+    
+    partitions = vcf_text_partitions(db_file, n_lines)
+    names = next(partitions)
     
-    # Adding identifier for validation of file    
-    V_data = {"Identifier": ["0:000000:Valid:File"]}
-    Valid_file = pd.DataFrame(V_data)
-    ClinVar_final = pd.concat([ClinVar_final, Valid_file], ignore_index=True)
+    n_variants = 0
+    fingerprints = []
     
-    ClinVar_final.to_csv(name, index=False, sep="\t")
+    print(f"Filtering variants in partitions of {n_lines} variants with {workers} workers...")
+    with pool, open(name, "w", newline="") as f:
         
-    print("\nAnnotation file created!")
+        def write_partition(result):
+            nonlocal n_variants
+            rows, partition_fingerprints, n_rows, stages = result.get()
+            with ProfileStage("Write partition", n_rows):
+                f.write(rows)
+            fingerprints.append(partition_fingerprints)
+            if _PROFILE is not None:
+                _PROFILE.stages.extend(stages)
+            print(f"Partition {len(fingerprints)} - variants {n_variants + 1}-{n_variants + n_rows}")
+            n_variants += n_rows
+        
+        # A few partitions per worker are queued at a time, so the file is not read into memory ahead of the workers.
+        pending = collections.deque()
+        for n_partition, text in enumerate(partitions):
+            pending.append(pool.apply_async(_filter_partition, (names, text, "w" if n_partition == 0 else "a")))
+            if len(pending) >= 2 * workers:
+                write_partition(pending.popleft())
+        while pending:
+            write_partition(pending.popleft())
+    
+    append_valid_file(name, mode="a" if fingerprints else "w")
+    
+    return np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=np.uint64)
+
+# Helper function to open the annotation store of the previous build for check_construct --previous.
+def open_previous_build(previous_file):
+    
+    previous = open_annotation_store(previous_file)
+    if previous is None:
+        if build_annotation_store(previous_file) is None:
+            return None
+        previous = open_annotation_store(previous_file)
+    
+    # Rows of another parser version may differ from the rows this version gives, so none are copied (AnnotationStore ignores their fingerprints).
+    if previous.source_hash is None and os.path.exists(os.path.join(previous.path, "source_hash.npy")):
+        print(f"{previous.path} was created by another parser version - all variants are filtered, only the changelog is incremental.")
+    elif previous.source_hash is None:
+        print(f"{previous.path} has no record fingerprints (it was created from an annotation file) - all variants are filtered, only the changelog is incremental.")
+    
+    return previous
+
+# Function to write the changelog between two builds: variants added, removed or reclassified (changed Clinical_significance). 
+# Variants are compared by Identifier; duplicated identifiers are compared in the order of the annotation files.
+def clinvar_changelog(previous, current, name):
+    
+    import numpy as np
+    import pandas as pd
+    
+    def significance_table(store):
+        table = pd.DataFrame({"key": np.asarray(store.key_hash), "row": np.asarray(store.row),
+                              "entry": np.arange(len(store)), "significance": store.column("Clinical_significance")})
+        table = table.sort_values("row", kind="stable")
+        table["occurrence"] = table.groupby("key").cumcount()
+        return table
+    
+    merged = significance_table(previous).merge(significance_table(current), on=["key", "occurrence"], how="outer",
+                                                 suffixes=("_previous", ""), indicator=True)
+    
+    added = merged[merged["_merge"] == "right_only"]
+    removed = merged[merged["_merge"] == "left_only"]
+    reclassified = merged[(merged["_merge"] == "both") & (merged["significance_previous"] != merged["significance"])]
+    
+    def changes(rows, store, entry, change):
+        table = store.decode(rows[entry].astype(np.int64).to_numpy(), raw=True)
+        return pd.DataFrame({"Identifier": table["Identifier"].to_numpy(),
+                             "Gene_symbol": table["Gene_symbol"].to_numpy(),
+                             "Change": change,
+                             "Previous_clinical_significance": rows["significance_previous"].to_numpy(),
+                             "Clinical_significance": rows["significance"].to_numpy(),
+                             "order": rows["row" if change != "removed" else "row_previous"].to_numpy()})
+    
+    changelog = pd.concat([pd.concat([changes(added, current, "entry", "added"),
+                                      changes(reclassified, current, "entry", "reclassified")]).sort_values("order", kind="stable"),
+                           changes(removed, previous, "entry_previous", "removed").sort_values("order", kind="stable")])
+    changelog.drop(columns=["order"]).to_csv(name, index=False, sep="\t")
+    
+    print(f"Changelog {previous.meta['source']} -> {current.meta['source']}: {len(added)} added, {len(removed)} removed, {len(reclassified)} reclassified variants - saved as {name}")
+    transitions = (reclassified["significance_previous"].fillna("") + " -> " + reclassified["significance"].fillna("")).value_counts()
+    for transition, count in transitions.head(10).items():
+        print(f"  {count:>8}  {transition}")
 
 # Construction of the annotation file.
 def check_construct(args):
     
     import gzip
     import shutil
-    import time
     import pandas as pd
     import io
     import os
@@ -289,63 +1055,809 @@ def check_construct(args):
     os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
 
     db_file = args.database_file
+    
+    previous = None
+    if args.previous:
+        if os.path.splitext(os.path.basename(args.previous))[0] == os.path.splitext(os.path.splitext(os.path.basename(db_file))[0])[0]:
+            print("The previous annotation file must be from another ClinVar database file.")
+            return
+        previous = open_previous_build(args.previous)
+        if previous is None:
+            return
+    source_hashes = None
+    
+    # Builds are cached by the checksum of the database file, so rebuilding the same ClinVar release restores the cached annotation file.
+    cache_key = None
+    if not args.no_cache and (db_file.endswith(".vcf.gz") or db_file.endswith(".vcf")) and os.path.exists(db_file):
+        with ProfileStage("Checksum"):
+            cache_key = build_cache_key(db_file)
+        cached_file_name = db_file[:-7] + ".tsv" if db_file.endswith(".gz") else db_file[:-4] + ".tsv"
+    store = None
 
     def read_vcf(file):
-        with open(file, 'r') as f:
+        with ProfileStage("Read") as stage, open(file, 'r') as f:
             lines = [l for l in f if not l.startswith('##')]
-            return pd.read_csv(
+            data_vcf = pd.read_csv(
                 io.StringIO(''.join(lines)),
-                dtype={'#CHROM': str, 'POS': int, 'ID': str, 'REF': str, 'ALT': str,
-                       'QUAL': str, 'FILTER': str, 'INFO': str},
+                dtype=VCF_DTYPES,
                 sep='\t'
             ).rename(columns={'#CHROM': 'CHR'})
+            stage.rows = len(data_vcf)
+            return data_vcf
 
-    if db_file.endswith(".gz"):
+    if cache_key is not None and restore_cached_build(cache_key, cached_file_name):
+        tsv_file_name = cached_file_name
+        store = store_path(tsv_file_name)
+    
+    elif args.workers > 1 and (db_file.endswith(".vcf.gz") or db_file.endswith(".vcf")):
+        tsv_file_name = db_file[:-7] + ".tsv" if db_file.endswith(".gz") else db_file[:-4] + ".tsv"
+        print(f"Creating annotation file from: {db_file} ({args.workers} workers)...")
+        source_hashes = Clinvar_parallel(db_file=db_file, name=tsv_file_name, workers=args.workers, n_lines=args.chunksize or PARTITION_SIZE, previous=previous)
+    
+    elif args.stream and (db_file.endswith(".vcf.gz") or db_file.endswith(".vcf")):
+        tsv_file_name = db_file[:-7] + ".tsv" if db_file.endswith(".gz") else db_file[:-4] + ".tsv"
+        chunksize = args.chunksize or CHUNKSIZE
+        print(f"Creating annotation file from: {db_file} (streaming, {chunksize} variants per chunk)...")
+        source_hashes = Clinvar_streaming(db_file=db_file, name=tsv_file_name, chunksize=chunksize, previous=previous)
+
+    elif db_file.endswith(".gz"):
         print("Decompressing the database file...")
         db_file_out = db_file[:-3]
-        with gzip.open(db_file, "rb") as f_in:
+        with ProfileStage("Decompress"), gzip.open(db_file, "rb") as f_in:
             with open(db_file_out, "wb") as f_out:
                 shutil.copyfileobj(f_in, f_out)
 
         print(f"{db_file_out}.gz has been decompressed and is available in {CLINVAR_DATABASE_DIRECTORY}")
-        time.sleep(2)
 
         print(f"Creating annotation file from: {db_file_out}...")
         data_vcf_file = read_vcf(db_file_out)
         tsv_file_name = db_file_out[:-4] + ".tsv"
-        test = Clinvar_filtering(data_vcf=data_vcf_file, name=tsv_file_name)
+        source_hashes = Clinvar_filtering(data_vcf=data_vcf_file, name=tsv_file_name, previous=previous)
         
 
     elif db_file.endswith(".vcf"):
         print(f"Creating annotation file from: {db_file}...")
         data_vcf_file = read_vcf(db_file)
         tsv_file_name = db_file[:-4] + ".tsv"
-        test = Clinvar_filtering(data_vcf=data_vcf_file, name=tsv_file_name)
-
-#%% Function to annotate input files
-# Helper function to skip commented lines in input files.
-def check_and_skip(file_to_check):
+        source_hashes = Clinvar_filtering(data_vcf=data_vcf_file, name=tsv_file_name, previous=previous)
     
-    lines_to_check = []
-    with open(file_to_check, "r") as ftc:
-        try: 
-            for line in ftc: 
-                if line.startswith("##"):
-                    lines_to_check.append(line)
-            return len(lines_to_check)
-        except:
-            return 0
-
-# Helper function to create identifier column
-def column_identifier(ann_file_):
+    elif db_file.endswith(".tsv"):
+        tsv_file_name = db_file
     
-    ann_file_["Identifier"] = ann_file_["Locus"] + ":" + ann_file_["Ref"] + ":" + ann_file_["Observed Allele"]
-    ann_file_["Identifier"] = ann_file_["Identifier"].astype("str")
-    ann_file_["Identifier"] = ann_file_["Identifier"].str.replace("chr", "")
+    else:
+        print("Database file must be .vcf.gz, .vcf or an annotation file (.tsv).")
+        return
+    
+    if store is None:
+        with ProfileStage("Annotation store"):
+            store = build_annotation_store(tsv_file_name, source_hashes=source_hashes)
+        if cache_key is not None and store is not None:
+            with ProfileStage("Add to build cache"):
+                add_cached_build(cache_key, db_file, tsv_file_name, store, max_size=args.cache_size)
+    
+    if previous is not None and store is not None:
+        with ProfileStage("Changelog"):
+            clinvar_changelog(previous, AnnotationStore(store), os.path.splitext(tsv_file_name)[0] + ".changes.tsv")
+
+#%% Function to create the annotation store
+# The annotation store is a directory next to the annotation file (clinvar_20230617.tsv -> clinvar_20230617.store) holding the same table in a memory-mappable form:
+# - key_hash.npy: 64-bit hashes of the Identifier column (CHR:POS:REF:ALT), sorted for binary search
+# - row.npy: the row of each entry in the annotation file, so duplicated identifiers keep their original order
+# - Identifier.bin/.off.npy: the identifiers in hash order, to confirm a hash hit
+# - <column>.codes.npy and <column>.bin/.off.npy: dictionary-encoded columns, holding the values exactly as written in the annotation file
+# - source_hash.npy (optional): fingerprints of the ClinVar records of each row of the annotation file (see vcf_fingerprints)
+# - norm_hash.npy/norm_entry.npy: the normalized variant index (see normalized_index)
+# - pos.npy/pos_entry.npy: the position index, entries sorted by chromosome and position, with the range of each chromosome in meta.json (see position_index)
+# - gene_hash.npy/gene_entry.npy: the gene index, entries sorted by the hash of their Gene_symbol (see gene_index)
+# annotate then only reads the entries of the identifiers present in the input files.
+
+# Helper function to get the path of the annotation store of an annotation file.
+def store_path(annotation_file):
+    
+    if annotation_file.endswith(STORE_EXTENSION):
+        return annotation_file
+    
+    return os.path.splitext(annotation_file)[0] + STORE_EXTENSION
+
+# Helper function to hash identifiers into unsigned 64-bit keys (stable across runs and platforms).
+def identifier_hashes(identifiers):
+    
+    import hashlib
+    import numpy as np
+    
+    digests = b"".join(hashlib.blake2b(str(x).encode("utf-8"), digest_size=8).digest() for x in identifiers)
+    
+    return np.frombuffer(digests, dtype="<u8")
+
+# Helper function to write strings as one utf-8 blob and the offsets of each string.
+def write_strings(path, values):
+    
+    import numpy as np
+    
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    
+    with open(path + ".bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(path + ".off.npy", offsets)
+
+# Helper function to memory-map strings written by write_strings.
+def read_strings(path):
+    
+    import numpy as np
+    
+    offsets = np.load(path + ".off.npy", mmap_mode="r")
+    if offsets[-1] == 0:
+        return np.zeros(0, dtype=np.uint8), offsets
+    
+    return np.memmap(path + ".bin", dtype=np.uint8, mode="r"), offsets
+
+# Helper function to get the values pandas reads as missing (NaN) from an annotation file.
+def tsv_na_values():
+    
+    try:
+        from pandas._libs.parsers import STR_NA_VALUES
+    except ImportError:
+        STR_NA_VALUES = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                         "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+    
+    return set(STR_NA_VALUES)
+
+# Helper function to normalize a variant: alleles in upper case, "-" as an empty allele, and the shared suffix and then the shared prefix of REF and ALT trimmed. 
+# Trimming the suffix first moves an indel to its leftmost position within the alleles; without the reference sequence, a representation shifted beyond the alleles cannot be left-aligned.
+def normalize_variant(chrom, pos, ref, alt):
+    
+    ref = "" if ref == "-" else ref.upper()
+    alt = "" if alt == "-" else alt.upper()
+    
+    while ref and alt and ref[-1] == alt[-1]:
+        ref, alt = ref[:-1], alt[:-1]
+    n = 0
+    while n < min(len(ref), len(alt)) and ref[n] == alt[n]:
+        n += 1
+    
+    return f"{chrom}:{pos + n}:{ref[n:]}:{alt[n:]}"
+
+# Helper function to write a chromosome the same way for ClinVar and input variants (e.g. chr1 -> 1, chrM -> MT).
+def normalized_chromosome(chrom):
+    
+    chrom = chrom[3:] if chrom.lower().startswith("chr") else chrom
+    
+    return "MT" if chrom.upper() == "M" else chrom.upper()
+
+# Helper function to get the normalized keys of an identifier (CHR:POS:REF:ALT): one per ALT allele of a multi-allelic variant. 
+# Gives no keys for identifiers that are not variants (e.g. missing alleles, ALT "." or symbolic alleles like <CNV>).
+def normalized_keys(identifier):
+    
+    parts = str(identifier).split(":")
+    if len(parts) != 4 or not parts[1].isdigit():
+        return []
+    chrom, pos, ref, alts = parts
+    chrom = normalized_chromosome(chrom)
+    
+    keys = []
+    for alt in alts.split(","):
+        if alt in (".", "*", "") or alt.startswith("<") or ref.startswith("<"):
+            continue
+        keys.append(normalize_variant(chrom, int(pos), ref, alt))
+    
+    return keys
+
+# Helper function to create the normalized variant index of the identifiers of an annotation store. 
+# Only identifiers whose normalized keys differ from the identifier itself (multi-allelic variants, indels with shared bases, ...) are indexed; the others are found by identifier. 
+# Gives the sorted key hashes and their entries.
+def normalized_index(identifiers):
+    
+    import numpy as np
+    
+    keys = []
+    entries = []
+    for entry, identifier in enumerate(identifiers):
+        for key in normalized_keys(identifier):
+            if key != identifier:
+                keys.append(key)
+                entries.append(entry)
+    
+    hashes = identifier_hashes(keys)
+    order = np.argsort(hashes, kind="stable")
+    
+    return hashes[order], np.asarray(entries, dtype=np.int64)[order]
+
+# Helper function to create the position index of the identifiers of an annotation store. 
+# Entries are sorted by chromosome (in the order of the annotation file), position and row; identifiers without a position are left out. 
+# Gives the sorted positions, their entries and the range of each chromosome in them.
+def position_index(identifiers, rows):
+    
+    import numpy as np
+    
+    chromosomes = {}
+    chrom_rank = np.zeros(len(identifiers), dtype=np.int64)
+    positions = np.full(len(identifiers), -1, dtype=np.int64)
+    for entry in np.argsort(rows, kind="stable").tolist():
+        parts = identifiers[entry].split(":")
+        if len(parts) < 2 or not parts[1].isdigit():
+            continue
+        chrom_rank[entry] = chromosomes.setdefault(normalized_chromosome(parts[0]), len(chromosomes))
+        positions[entry] = int(parts[1])
+    
+    entries = np.flatnonzero(positions >= 0)
+    entries = entries[np.lexsort((rows[entries], positions[entries], chrom_rank[entries]))]
+    bounds = np.searchsorted(chrom_rank[entries], np.arange(len(chromosomes) + 1))
+    ranges = {chrom: [int(bounds[rank]), int(bounds[rank + 1])] for chrom, rank in chromosomes.items()}
+    
+    return positions[entries], entries.astype(np.int64), ranges
+
+# Helper function to create the gene index of an annotation store from its Gene_symbol codes and categories. 
+# Genes are hashed in upper case, and entries are sorted by hash and row; entries without a gene symbol are left out. 
+# Gives the sorted hashes and their entries.
+def gene_index(codes, categories, rows):
+    
+    import numpy as np
+    
+    na_values = tsv_na_values()
+    category_hash = identifier_hashes([c.upper() for c in categories])
+    
+    entries = np.flatnonzero(codes >= 0)
+    entries = entries[np.array([categories[c] not in na_values for c in codes[entries].tolist()], dtype=bool)]
+    hashes = category_hash[codes[entries]]
+    order = np.lexsort((rows[entries], hashes))
+    
+    return hashes[order], entries[order].astype(np.int64)
+
+# Helper function to get the memory of dictionary-encoded columns (codes and categories), and of the same columns as Python strings. 
+# Strings are counted as pandas' memory_usage(deep=True) counts them: an 8-byte reference per row plus the size of each value (NaN for code -1).
+def encoded_memory(codes, categories):
+    
+    import numpy as np
+    
+    encoded_size = 0
+    object_size = 0
+    for c in codes:
+        sizes = np.array([sys.getsizeof(v) for v in categories[c]] + [sys.getsizeof(np.nan)], dtype=np.int64)
+        encoded_size += codes[c].nbytes + int(sizes[:-1].sum())
+        object_size += 8 * len(codes[c]) + int(sizes[codes[c]].sum())
+    
+    return encoded_size, object_size
+
+# Helper function to report the memory saved by dictionary-encoded columns.
+def memory_string(encoded_size, object_size):
+    
+    return f"{encoded_size / 1e6:.1f} MB dictionary-encoded, {object_size / 1e6:.1f} MB as strings ({1 - encoded_size / max(object_size, 1):.0%} less)"
+
+# Function to create the annotation store from an annotation file.
+def build_annotation_store(annotation_file, source_hashes=None):
+    
+    import json
+    import shutil
+    import numpy as np
+    import pandas as pd
+    
+    store = store_path(annotation_file)
+    store_tmp = store + ".tmp"
+    columns = ANNOTATION_COLUMNS[1:]
+    
+    print(f"Creating annotation store: {store}")
+    
+    # Values are kept exactly as written; AnnotationStore.decode gives missing values where pandas would read them (e.g. empty fields).
+    identifiers = []
+    codes = {c: [] for c in columns}
+    categories = {c: {} for c in columns}
+    last_identifier = None
+    
+    for chunk in pd.read_csv(annotation_file, sep="\t", dtype=str, na_filter=False, chunksize=CHUNKSIZE):
+        if chunk.empty:
+            continue
+        last_identifier = chunk["Identifier"].iloc[-1]
+        identifiers.extend(chunk["Identifier"].tolist())
+        for c in columns:
+            for value in pd.unique(chunk[c].dropna()):
+                categories[c].setdefault(value, len(categories[c]))
+            codes[c].append(chunk[c].map(categories[c]).fillna(-1).to_numpy(dtype=np.int32))
+    
+    if last_identifier != VALID_FILE_IDENTIFIER:
+        print("Invalid annotation file encountered! No annotation store created.")
+        return None
+    
+    # The validation identifier is kept out of the store; the meta file marks the store as complete instead.
+    identifiers = identifiers[:-1]
+    hashes = identifier_hashes(identifiers)
+    order = np.argsort(hashes, kind="stable")
+    
+    if os.path.exists(store_tmp):
+        shutil.rmtree(store_tmp)
+    os.mkdir(store_tmp)
+    
+    np.save(os.path.join(store_tmp, "key_hash.npy"), hashes[order])
+    np.save(os.path.join(store_tmp, "row.npy"), order.astype(np.int64))
+    write_strings(os.path.join(store_tmp, "Identifier"), [identifiers[i] for i in order])
+    norm_hash, norm_entry = normalized_index([identifiers[i] for i in order])
+    np.save(os.path.join(store_tmp, "norm_hash.npy"), norm_hash)
+    np.save(os.path.join(store_tmp, "norm_entry.npy"), norm_entry)
+    for c in columns:
+        codes[c] = np.concatenate(codes[c])[:-1][order]
+        np.save(os.path.join(store_tmp, f"{c}.codes.npy"), codes[c])
+        write_strings(os.path.join(store_tmp, c), list(categories[c]))
+    pos, pos_entry, chromosomes = position_index([identifiers[i] for i in order], order)
+    np.save(os.path.join(store_tmp, "pos.npy"), pos)
+    np.save(os.path.join(store_tmp, "pos_entry.npy"), pos_entry)
+    gene_hash, gene_entry = gene_index(codes["Gene_symbol"], list(categories["Gene_symbol"]), order)
+    encoded_size, object_size = encoded_memory(codes, categories)
+    np.save(os.path.join(store_tmp, "gene_hash.npy"), gene_hash)
+    np.save(os.path.join(store_tmp, "gene_entry.npy"), gene_entry)
+    if source_hashes is not None and len(source_hashes) == len(identifiers):
+        np.save(os.path.join(store_tmp, "source_hash.npy"), np.asarray(source_hashes, dtype=np.uint64))
+    
+    source = os.stat(annotation_file)
+    meta = {"format": STORE_FORMAT,
+            "source": os.path.basename(annotation_file),
+            "source_size": source.st_size,
+            "source_mtime": source.st_mtime,
+            "rows": len(identifiers),
+            "parser_version": PARSER_VERSION,
+            "normalized_keys": len(norm_hash),
+            "chromosomes": chromosomes,
+            "encoded_size": encoded_size,
+            "object_size": object_size,
+            "columns": columns}
+    with open(os.path.join(store_tmp, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    
+    if os.path.exists(store):
+        shutil.rmtree(store)
+    os.replace(store_tmp, store)
+    
+    print(f"Annotation store created! ({len(identifiers)} variants)")
+    print(f"Annotation columns: {memory_string(encoded_size, object_size)}")
+    
+    return store
+
+# Class giving memory-mapped lookups in an annotation store.
+class AnnotationStore:
+    
+    def __init__(self, store):
+        
+        import json
+        import numpy as np
+        
+        self.path = store
+        with open(os.path.join(store, "meta.json")) as f:
+            self.meta = json.load(f)
+        
+        self.columns = self.meta["columns"]
+        self.key_hash = np.load(os.path.join(store, "key_hash.npy"), mmap_mode="r")
+        self.row = np.load(os.path.join(store, "row.npy"), mmap_mode="r")
+        self.identifiers = read_strings(os.path.join(store, "Identifier"))
+        self.codes = {c: np.load(os.path.join(store, f"{c}.codes.npy"), mmap_mode="r") for c in self.columns}
+        self.categories = {c: read_strings(os.path.join(store, c)) for c in self.columns}
+        self.na_values = tsv_na_values()
+        
+        # Record fingerprints are only used with the parser version that created the rows (see check_construct --previous).
+        source_hash = os.path.join(store, "source_hash.npy")
+        self.source_hash = np.load(source_hash, mmap_mode="r") if os.path.exists(source_hash) and self.meta.get("parser_version") == PARSER_VERSION else None
+        self._fingerprint_index = None
+        
+        # Normalized variant index (not in stores created before it was added).
+        norm_hash = os.path.join(store, "norm_hash.npy")
+        self.norm_hash = np.load(norm_hash, mmap_mode="r") if os.path.exists(norm_hash) else None
+        self.norm_entry = np.load(os.path.join(store, "norm_entry.npy"), mmap_mode="r") if self.norm_hash is not None else None
+        
+        self.pos = np.load(os.path.join(store, "pos.npy"), mmap_mode="r")
+        self.pos_entry = np.load(os.path.join(store, "pos_entry.npy"), mmap_mode="r")
+        self.gene_hash = np.load(os.path.join(store, "gene_hash.npy"), mmap_mode="r")
+        self.gene_entry = np.load(os.path.join(store, "gene_entry.npy"), mmap_mode="r")
+    
+    def __len__(self):
+        return self.meta["rows"]
+    
+    # Helper function to decode string i of a blob/offsets pair.
+    @staticmethod
+    def _string(strings, i):
+        blob, offsets = strings
+        return blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+    
+    # Helper function to find the store entries (in annotation file order) of the given identifiers.
+    def find(self, identifiers):
+        
+        import numpy as np
+        
+        identifiers = list(dict.fromkeys(str(x) for x in identifiers))
+        hashes = identifier_hashes(identifiers)
+        left = np.searchsorted(self.key_hash, hashes, side="left")
+        right = np.searchsorted(self.key_hash, hashes, side="right")
+        
+        entries = [i for identifier, l, r in zip(identifiers, left.tolist(), right.tolist()) for i in range(l, r)
+                   if self._string(self.identifiers, i) == identifier]
+        entries = np.asarray(entries, dtype=np.int64)
+        
+        return entries[np.argsort(self.row[entries], kind="stable")]
+    
+    # Helper function to find the store entries of the variants in a region of a chromosome (positions start to end, 1-based and inclusive), in position order.
+    def find_region(self, chrom, start, end):
+        
+        import numpy as np
+        
+        if normalized_chromosome(chrom) not in self.meta["chromosomes"]:
+            return np.zeros(0, dtype=np.int64)
+        
+        first, last = self.meta["chromosomes"][normalized_chromosome(chrom)]
+        positions = self.pos[first:last]
+        
+        return np.asarray(self.pos_entry[first + np.searchsorted(positions, start, side="left"):first + np.searchsorted(positions, end, side="right")])
+    
+    # Helper function to find the store entries of a gene (by Gene_symbol, in any case), in annotation file order.
+    def find_gene(self, gene):
+        
+        import numpy as np
+        
+        gene = gene.upper()
+        gene_hash = identifier_hashes([gene])[0]
+        first, last = np.searchsorted(self.gene_hash, gene_hash, side="left"), np.searchsorted(self.gene_hash, gene_hash, side="right")
+        
+        entries = [e for e in self.gene_entry[first:last].tolist() if self._string(self.categories["Gene_symbol"], self.codes["Gene_symbol"][e]).upper() == gene]
+        
+        return np.asarray(entries, dtype=np.int64)
+    
+    # Helper function to keep the store entries whose value of a column is one of the given values (in any case).
+    def filter_entries(self, entries, c, values):
+        
+        import numpy as np
+        
+        values = {v.lower() for v in values}
+        blob, offsets = self.categories[c]
+        codes = [i for i in range(len(offsets) - 1) if self._string(self.categories[c], i).lower() in values]
+        
+        return entries[np.isin(self.codes[c][entries], codes)]
+    
+    # Helper function to decode store entries into a table with the columns of the annotation file. 
+    # Values pandas reads as missing from the annotation file are given as missing values, unless raw=True.
+    def decode(self, entries, raw=False):
+        
+        import pandas as pd
+        
+        table = {"Identifier": [self._string(self.identifiers, i) for i in entries]}
+        for c in self.columns:
+            codes = self.codes[c][entries].tolist()
+            decoded = {code: self._string(self.categories[c], code) for code in set(codes) if code >= 0}
+            if not raw:
+                decoded = {code: value for code, value in decoded.items() if value not in self.na_values}
+            table[c] = [decoded.get(code) for code in codes]
+        
+        return pd.DataFrame(table, columns=ANNOTATION_COLUMNS, dtype=object)
+    
+    # Helper function to decode a whole column (in store order, values as written).
+    def column(self, c):
+        
+        import numpy as np
+        
+        blob, offsets = self.categories[c]
+        categories = np.array([self._string(self.categories[c], i) for i in range(len(offsets) - 1)] + [None], dtype=object)
+        
+        return categories[np.asarray(self.codes[c])]
+    
+    # Helper function to find the entries of ClinVar records already in the store (by fingerprint, confirmed by identifier). 
+    # Gives a mask of the records found and their entries.
+    def match_fingerprints(self, fingerprints, identifiers):
+        
+        import numpy as np
+        
+        if self.source_hash is None or len(self.source_hash) == 0:
+            return np.zeros(len(fingerprints), dtype=bool), np.zeros(0, dtype=np.int64)
+        
+        if self._fingerprint_index is None:
+            entry_of_row = np.empty(len(self.row), dtype=np.int64)
+            entry_of_row[np.asarray(self.row)] = np.arange(len(self.row))
+            order = np.argsort(self.source_hash, kind="stable")
+            self._fingerprint_index = (np.asarray(self.source_hash)[order], entry_of_row[order])
+        sorted_hash, entries_by_hash = self._fingerprint_index
+        
+        pos = np.minimum(np.searchsorted(sorted_hash, fingerprints), len(sorted_hash) - 1)
+        found = sorted_hash[pos] == fingerprints
+        found[found] = [self._string(self.identifiers, e) == i for e, i in zip(entries_by_hash[pos[found]].tolist(), identifiers[found])]
+        
+        return found, entries_by_hash[pos[found]]
+    
+    # Function to look up identifiers; gives the rows of the annotation file matching them.
+    def lookup(self, identifiers):
+        return self.decode(self.find(identifiers))
+    
+    # Function to look up identifiers, matching identifiers not found as written by their normalized keys (see normalized_keys). 
+    # Gives the rows of the annotation file matching them, with the identifier looked up as Identifier and the identifier of the annotation file as ClinVar_identifier.
+    def lookup_normalized(self, identifiers):
+        
+        import numpy as np
+        import pandas as pd
+        
+        if self.norm_hash is None:
+            raise ValueError(f"Annotation store {self.path} has no normalized variant index - rerun check_construct on its annotation file to update it.")
+        
+        identifiers = list(dict.fromkeys(str(x) for x in identifiers))
+        exact = self.lookup(identifiers)
+        exact["ClinVar_identifier"] = exact["Identifier"]
+        
+        found = set(exact["Identifier"])
+        queries = [(identifier, key) for identifier in identifiers if identifier not in found for key in normalized_keys(identifier)]
+        keys = list(dict.fromkeys(key for _, key in queries))
+        
+        # Entries of each normalized key: by identifier, and in the normalized variant index.
+        key_entries = {}
+        if keys:
+            hashes = identifier_hashes(keys)
+            for key, l, r in zip(keys, np.searchsorted(self.key_hash, hashes, side="left").tolist(), np.searchsorted(self.key_hash, hashes, side="right").tolist()):
+                key_entries[key] = [i for i in range(l, r) if self._string(self.identifiers, i) == key]
+            for key, l, r in zip(keys, np.searchsorted(self.norm_hash, hashes, side="left").tolist(), np.searchsorted(self.norm_hash, hashes, side="right").tolist()):
+                key_entries[key] += [e for e in self.norm_entry[l:r].tolist() if key in normalized_keys(self._string(self.identifiers, e))]
+        
+        pairs = list(dict.fromkeys((identifier, entry) for identifier, key in queries for entry in key_entries.get(key, [])))
+        pairs.sort(key=lambda pair: self.row[pair[1]])
+        normalized = self.decode(np.asarray([entry for _, entry in pairs], dtype=np.int64))
+        normalized["ClinVar_identifier"] = normalized["Identifier"]
+        normalized["Identifier"] = [identifier for identifier, _ in pairs]
+        
+        return pd.concat([exact, normalized], ignore_index=True)
+
+# Helper function to open the annotation store of an annotation file if it exists and is up-to-date.
+def open_annotation_store(annotation_file):
+    
+    import json
+    
+    store = store_path(annotation_file)
+    meta_file = os.path.join(store, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    
+    with open(meta_file) as f:
+        meta = json.load(f)
+    
+    if meta.get("format") != STORE_FORMAT:
+        print(f"Annotation store {store} has an old format - rerun check_construct to update it.")
+        return None
+    
+    if os.path.exists(annotation_file) and not annotation_file.endswith(STORE_EXTENSION):
+        source = os.stat(annotation_file)
+        if source.st_size != meta["source_size"] or source.st_mtime != meta["source_mtime"]:
+            print(f"Annotation store {store} does not match {annotation_file} - rerun check_construct to update it.")
+            return None
+    
+    return AnnotationStore(store)
+
+# Helper function to load the annotation table: the annotation store when available, else the annotation file.
+def load_annotation(annotation_file, verbose=True):
+    
+    annotation_store = open_annotation_store(annotation_file)
+    if annotation_store is not None:
+        if verbose:
+            print(f"Using annotation store: {annotation_store.path} ({len(annotation_store)} variants)")
+            if "encoded_size" in annotation_store.meta:
+                print(f"Annotation columns: {memory_string(annotation_store.meta['encoded_size'], annotation_store.meta['object_size'])}")
+        return annotation_store
+    
+    import pandas as pd
+    
+    # The repetitive columns are loaded as categoricals; annotate_table decodes them for the merged rows only.
+    annotation_df = pd.read_csv(annotation_file, sep="\t", dtype={c: "category" for c in CATEGORY_COLUMNS})
+    
+    for f in annotation_df.Identifier.iloc[[-1]]:
+      if f != VALID_FILE_IDENTIFIER:
+          raise ValueError("Invalid annotation file encountered!")
+    
+    if verbose:
+        codes = {c: annotation_df[c].cat.codes.to_numpy() for c in CATEGORY_COLUMNS}
+        categories = {c: annotation_df[c].cat.categories.tolist() for c in CATEGORY_COLUMNS}
+        print(f"Using annotation file: {annotation_file} ({len(annotation_df) - 1} variants)")
+        print(f"Annotation columns: {memory_string(*encoded_memory(codes, categories))}")
+    
+    return annotation_df
+
+# Helper function to get the part of the annotation table needed for the given identifiers.
+# With normalize=True, identifiers are also matched by their normalized keys (annotation stores and services only).
+def annotation_lookup(annotation, identifiers, normalize=False):
+    
+    import pandas as pd
+    
+    if isinstance(annotation, pd.DataFrame):
+        if normalize:
+            raise ValueError("Matching normalized variants needs the annotation store - rerun check_construct on the annotation file to create it.")
+        return annotation[annotation["Identifier"].isin(set(identifiers))]
+    
+    if normalize:
+        return annotation.lookup(identifiers, normalize=True) if isinstance(annotation, AnnotationClient) else annotation.lookup_normalized(identifiers)
+    
+    return annotation.lookup(identifiers)
+
+#%% Function to manage the build cache
+# The build cache in ./clinvar_database_files/.cache holds the annotation files (with their annotation stores) built by check_construct. 
+# An entry is keyed by the SHA-256 checksum of the ClinVar database file and the versions of the parser (PARSER_VERSION) and store format, and is removed when it is the least recently used entry and the cache is above its maximum size.
+
+# Helper function to get the key of the build cache for a ClinVar database file.
+def build_cache_key(db_file):
+    
+    import hashlib
+    
+    checksum = hashlib.sha256()
+    with open(db_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    
+    return f"{checksum.hexdigest()}-p{PARSER_VERSION}-s{STORE_FORMAT}"
+
+# Helper function to get the size (bytes) of a file or directory.
+def path_size(path):
+    
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+# Helper function to list the entries of the build cache, least recently used first.
+def cache_entries():
+    
+    import json
+    
+    entries = []
+    if not os.path.isdir(CACHE_DIRECTORY):
+        return entries
+    
+    for key in os.listdir(CACHE_DIRECTORY):
+        entry_file = os.path.join(CACHE_DIRECTORY, key, "entry.json")
+        if not os.path.exists(entry_file):
+            continue
+        with open(entry_file) as f:
+            entry = json.load(f)
+        entry["key"] = key
+        entries.append(entry)
+    
+    return sorted(entries, key=lambda entry: entry["last_used"])
+
+# Helper function to restore the annotation file (and annotation store) of a cached build. Gives False when the build is not cached.
+def restore_cached_build(key, tsv_file_name):
+    
+    import json
+    import shutil
+    import time
+    
+    entry_directory = os.path.join(CACHE_DIRECTORY, key)
+    entry_file = os.path.join(entry_directory, "entry.json")
+    if not os.path.exists(entry_file):
+        return False
+    
+    with ProfileStage("Restore from build cache"):
+        with open(entry_file) as f:
+            entry = json.load(f)
+        print(f"Restoring annotation file from the build cache (built from {entry['source']} on {entry['created']})...")
+        
+        # The modification time is kept, so the cached annotation store matches the annotation file.
+        shutil.copy2(os.path.join(entry_directory, "annotation.tsv"), tsv_file_name)
+        store = store_path(tsv_file_name)
+        if os.path.exists(store):
+            shutil.rmtree(store)
+        shutil.copytree(os.path.join(entry_directory, "annotation.store"), store)
+        with open(os.path.join(store, "meta.json")) as f:
+            meta = json.load(f)
+        meta["source"] = os.path.basename(tsv_file_name)
+        with open(os.path.join(store, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+        
+        entry["last_used"] = time.time()
+        with open(entry_file, "w") as f:
+            json.dump(entry, f, indent=1)
+    
+    print(f"\nAnnotation file created! ({entry['rows']} variants, restored from the build cache)")
+    
+    return True
+
+# Helper function to add a build to the build cache, and to evict the least recently used builds above max_size (GB).
+def add_cached_build(key, db_file, tsv_file_name, store, max_size=CACHE_MAX_SIZE_GB):
+    
+    import json
+    import shutil
+    import time
+    
+    entry_directory = os.path.join(CACHE_DIRECTORY, key)
+    if os.path.exists(entry_directory):
+        return
+    
+    entry_tmp = entry_directory + ".tmp"
+    if os.path.exists(entry_tmp):
+        shutil.rmtree(entry_tmp)
+    os.makedirs(entry_tmp)
+    
+    shutil.copy2(tsv_file_name, os.path.join(entry_tmp, "annotation.tsv"))
+    shutil.copytree(store, os.path.join(entry_tmp, "annotation.store"))
+    with open(os.path.join(store, "meta.json")) as f:
+        rows = json.load(f)["rows"]
+    
+    entry = {"source": os.path.basename(db_file),
+             "source_size": os.path.getsize(db_file),
+             "parser_version": PARSER_VERSION,
+             "store_format": STORE_FORMAT,
+             "rows": rows,
+             "size": path_size(entry_tmp),
+             "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+             "last_used": time.time()}
+    with open(os.path.join(entry_tmp, "entry.json"), "w") as f:
+        json.dump(entry, f, indent=1)
+    
+    try:
+        os.replace(entry_tmp, entry_directory)
+    except OSError:
+        shutil.rmtree(entry_tmp, ignore_errors=True)
+        return
+    print(f"Annotation file added to the build cache ({entry['size'] / 1e6:.1f} MB)")
+    
+    prune_cache(max_size)
+
+# Helper function to remove the least recently used builds until the build cache is at most max_size (GB). Gives the removed entries.
+def prune_cache(max_size):
+    
+    import shutil
+    
+    entries = cache_entries()
+    total = sum(entry["size"] for entry in entries)
+    removed = []
+    
+    for entry in entries:
+        if total <= max_size * 1e9:
+            break
+        shutil.rmtree(os.path.join(CACHE_DIRECTORY, entry["key"]), ignore_errors=True)
+        total -= entry["size"]
+        removed.append(entry)
+        print(f"Removed from the build cache: {entry['source']} ({entry['size'] / 1e6:.1f} MB, last used {time_string(entry['last_used'])})")
+    
+    return removed
+
+# Helper function to format a time stamp.
+def time_string(timestamp):
+    
+    import time
+    
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+# Function to list or prune the build cache.
+def cache(args):
+    
+    from tabulate import tabulate
+    
+    os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
+    
+    if args.action == "prune":
+        removed = prune_cache(0 if args.all else args.max_size)
+        print(f"{len(removed)} builds removed from the build cache.")
+    
+    entries = cache_entries()
+    if not entries:
+        print("The build cache is empty.")
+        return
+    
+    table = [[entry["source"], entry["rows"], round(entry["size"] / 1e6, 1), entry["created"], time_string(entry["last_used"]),
+              entry["key"][:12]] for entry in reversed(entries)]
+    print(tabulate(table, headers=["Database file", "Variants", "Size (MB)", "Created", "Last used", "Checksum"], tablefmt="github"))
+    print(f"\n{len(entries)} builds, {sum(entry['size'] for entry in entries) / 1e6:.1f} MB in ./{CLINVAR_DATABASE_DIRECTORY}/{CACHE_DIRECTORY}")
+
+#%% Function to annotate input files
+# Helper function to skip commented lines in input files.
+def check_and_skip(file_to_check):
+    
+    lines_to_check = []
+    with open(file_to_check, "r") as ftc:
+        try: 
+            for line in ftc: 
+                if line.startswith("##"):
+                    lines_to_check.append(line)
+            return len(lines_to_check)
+        except:
+            return 0
+
+# Helper function to create identifier column
+def column_identifier(ann_file_):
+    
+    ann_file_["Identifier"] = ann_file_["Locus"] + ":" + ann_file_["Ref"] + ":" + ann_file_["Observed Allele"]
+    ann_file_["Identifier"] = ann_file_["Identifier"].astype("str")
+    ann_file_["Identifier"] = ann_file_["Identifier"].str.replace("chr", "")
     
     return ann_file_
 
-# Helper function to move files
+# Helper function to move files. Gives whether the file was moved.
 def move_files(file):
     
     import shutil
@@ -354,6 +1866,7 @@ def move_files(file):
         try:
             shutil.move(os.path.join(INPUT_FILES_DIRECTORY, file), os.path.join(OUTPUT_ANNOTATED_DIRECTORY, file))
             print("Annotated files moved successfully to ./output_files_annotated.")
+            return True
         except shutil.SameFileError:
             print("Source and destination represent the same file.")
         except PermissionError:
@@ -364,71 +1877,335 @@ def move_files(file):
         try:
             shutil.move(os.path.join(INPUT_FILES_DIRECTORY, file), os.path.join(ARCHIVE_DIRECTORY, file))
             print("Original files moved successfully to ./archive.")
+            return True
         except shutil.SameFileError:
             print("Source and destination represent the same file.")
         except PermissionError:
             print("Permission denied.")
         except:
             print("Error occurred while moving the file.")
+    
+    return False
 
-# Helper function for progress
-def alive_bar_(ann_file):
+# Helper function to annotate the variants of an input table.
+def annotate_table(ann_file, annotation_df, file=None, normalize=False):
     
-    from alive_progress import alive_bar
-    import time
+    import pandas as pd
+    
+    with ProfileStage("identifier", len(ann_file), file=file):
+        ann_file = column_identifier(ann_file)
+    with ProfileStage("merge", len(ann_file), file=file):
+        ann_file = pd.merge(ann_file, annotation_lookup(annotation_df, ann_file["Identifier"], normalize=normalize), how="left", on="Identifier")
+        # Categorical columns of the annotation table (see load_annotation) are decoded after the merge, so only the matched rows are decoded.
+        for c in CATEGORY_COLUMNS:
+            if c in ann_file and isinstance(ann_file[c].dtype, pd.CategoricalDtype):
+                ann_file[c] = ann_file[c].astype(object)
+        ann_file["Clinical_significance"] = ann_file["Clinical_significance"].fillna("Manually inspection needed.")
+    
+    return ann_file
+
+# Helper function to find the column types pandas gives a whole file, from the column types of its chunks. 
+# Reading the chunks with these types writes the values the same way as when the file is read at once.
+def chunked_dtypes(a, sep, nlines, chunksize):
+    
+    import numpy as np
+    import pandas as pd
+    
+    chunk_dtypes = {}
+    for chunk in pd.read_csv(a, sep=sep, skiprows=nlines, chunksize=chunksize):
+        for column, dtype in chunk.dtypes.items():
+            chunk_dtypes.setdefault(column, set()).add(dtype)
+    
+    dtypes = {}
+    for column, types in chunk_dtypes.items():
+        if len(types) == 1:
+            dtypes[column] = types.pop()
+        elif all(np.issubdtype(t, np.number) for t in types):
+            dtypes[column] = np.float64
+        else:
+            dtypes[column] = object
+    
+    return dtypes
+
+# Helper function to read the first sheet of an .xlsx file in read-only (streaming) mode. 
+# Cells are converted as pd.read_excel converts them (empty cells as "", errors as NaN, whole numbers as int) and parsed with the same TextParser, so the table is the same.
+def read_xlsx_stream(a, nlines=0):
+    
+    import numpy as np
+    import pandas as pd
+    from openpyxl import load_workbook
+    from pandas.errors import EmptyDataError
+    from pandas.io.parsers import TextParser
+    
+    workbook = load_workbook(a, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        
+        data = []
+        last_row_with_data = -1
+        for row in sheet.rows:
+            values = []
+            for cell in row:
+                value = cell.value
+                if value is None:
+                    value = ""
+                elif cell.data_type == "e":
+                    value = np.nan
+                elif cell.data_type == "n":
+                    value = int(value) if int(value) == value else float(value)
+                values.append(value)
+            while values and values[-1] == "":
+                values.pop()
+            if values:
+                last_row_with_data = len(data)
+            data.append(values)
+    finally:
+        workbook.close()
+    
+    data = data[:last_row_with_data + 1]
+    if not data:
+        return pd.DataFrame()
+    width = max(len(values) for values in data)
+    data = [values + [""] * (width - len(values)) for values in data]
     
-    with alive_bar(ann_file.shape[0]) as bar:
-        for _ in range(ann_file.shape[0]):
-            time.sleep(0)
-            bar()
+    try:
+        return TextParser(data, header=0, skiprows=nlines, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+# Helper function to write a table to an .xlsx file in write-only (streaming) mode, with the cell values of to_excel(index=False): missing values as empty cells and infinity as "inf"/"-inf". 
+# Only the values are written; the header is not formatted as by to_excel.
+def write_xlsx_stream(ann_file, name):
+    
+    import math
+    import pandas as pd
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(list(ann_file.columns))
+    
+    for row in ann_file.itertuples(index=False, name=None):
+        values = list(row)
+        for i, value in enumerate(values):
+            if isinstance(value, float) and not math.isfinite(value):
+                values[i] = None if math.isnan(value) else ("inf" if value > 0 else "-inf")
+            elif value is pd.NaT or value is pd.NA:
+                values[i] = None
+        sheet.append(values)
+    
+    workbook.save(name)
+
+# Helper function for annotating a .tsv/.csv file in chunks of rows, appending each annotated chunk to the annotated file. 
+# Memory use is bounded by the chunk size; the annotated file is the same as from file_type_handling without chunks.
+def file_chunk_handling(a, nlines, annotation_df, chunksize, normalize=False, output=None):
+    
+    import pandas as pd
+    
+    output = output or annotated_file_name(a)
+    
+    doc_type = a.split(".")[-1]
+    sep = "\t" if doc_type == "tsv" else ";"
+    out_sep = "\t" if doc_type == "tsv" else ","
+    
+    with ProfileStage("column types", file=a):
+        dtypes = chunked_dtypes(a, sep, nlines, chunksize)
+    
+    n_rows = 0
+    mode = "w"
+    chunks = pd.read_csv(a, sep=sep, skiprows=nlines, chunksize=chunksize, dtype=dtypes)
+    while True:
+        with ProfileStage("read", file=a) as stage:
+            ann_file = next(chunks, None)
+            stage.rows = 0 if ann_file is None else len(ann_file)
+        if ann_file is None:
+            break
+        ann_file = annotate_table(ann_file, annotation_df, file=a, normalize=normalize)
+        with ProfileStage("write", len(ann_file), file=a):
+            ann_file.index = pd.RangeIndex(n_rows, n_rows + len(ann_file))
+            ann_file.to_csv(output, sep=out_sep, mode=mode, header=(mode == "w"))
+        n_rows += len(ann_file)
+        mode = "a"
 
 # Helper function for handling annotations of files.
-def file_type_handling(a, nlines, annotation_df):
+# .xlsx files are read and written with pandas (excel_engine="pandas") or in streaming mode (excel_engine="stream", see read_xlsx_stream); sidecar=True also saves them as .ann.xlsx.tsv.
+# The annotated file is written to output (default: the name given by annotated_file_name).
+def file_type_handling(a, nlines, annotation_df, chunksize=None, normalize=False, excel_engine="pandas", sidecar=False, output=None):
     
     import pandas as pd
     
     doc_type = a.split(".")[-1]
+    output = output or annotated_file_name(a)
+    
+    if chunksize and doc_type in ("tsv", "csv"):
+        return file_chunk_handling(a, nlines, annotation_df, chunksize, normalize=normalize, output=output)
         
-    if doc_type == "tsv":
-        ann_file = pd.read_csv(a, sep=("\t"), skiprows=nlines)
-        alive_bar_(ann_file)
-        
-    elif doc_type == "xlsx":
-        ann_file = pd.read_excel(a, skiprows=nlines)
-        alive_bar_(ann_file)
-           
-    elif doc_type == "csv":
-        ann_file = pd.read_csv(a, sep=(";"), skiprows=nlines)
-        alive_bar_(ann_file)
+    if doc_type not in ("tsv", "xlsx", "csv"):
+        raise ValueError(f"Unsupported file type: .{doc_type} (use .tsv, .csv or .xlsx)")
+    
+    with ProfileStage("read", file=a) as stage:
+        if doc_type == "tsv":
+            ann_file = pd.read_csv(a, sep=("\t"), skiprows=nlines)
+            
+        elif doc_type == "xlsx":
+            ann_file = read_xlsx_stream(a, nlines) if excel_engine == "stream" else pd.read_excel(a, skiprows=nlines)
+               
+        elif doc_type == "csv":
+            ann_file = pd.read_csv(a, sep=(";"), skiprows=nlines)
+        stage.rows = len(ann_file)
         
-    ann_file = column_identifier(ann_file)
-    ann_file = pd.merge(ann_file, annotation_df, how="left", on="Identifier")
-    ann_file["Clinical_significance"] = ann_file["Clinical_significance"].fillna("Manually inspection needed.")
+    ann_file = annotate_table(ann_file, annotation_df, file=a, normalize=normalize)
+    
+    with ProfileStage("write", len(ann_file), file=a):
+        if doc_type == "tsv":
+            ann_file.to_csv(output, sep="\t")
+        elif doc_type == "xlsx":
+            if excel_engine == "stream":
+                write_xlsx_stream(ann_file, output)
+            else:
+                # Written through a file object, so output does not need an .xlsx extension (e.g. the part files of watch).
+                with open(output, "wb") as f:
+                    ann_file.to_excel(f, index=False, engine="openpyxl")
+            if sidecar:
+                ann_file.to_csv(sidecar_file_name(a), sep="\t")
+        elif doc_type == "csv":
+            ann_file.to_csv(output)
+
+# Helper function to get the name of the annotated file of an input file.
+def annotated_file_name(a):
+    
+    doc_type = a.split(".")[-1]
+    
+    return a[:-len(doc_type)] + "ann" + f".{doc_type}"
+
+# Helper function to get the name of the .tsv sidecar of an annotated .xlsx file (annotate --sidecar). 
+# sample.xlsx gives sample.ann.xlsx.tsv, which cannot be the annotated file of another input file (e.g. sample.ann.tsv of sample.tsv).
+def sidecar_file_name(a):
+    
+    return annotated_file_name(a) + ".tsv"
+
+# Annotation table of the worker processes of annotate --workers (set before the workers are forked, or loaded once per worker by _init_annotate_worker).
+_ANNOTATION = None
+
+# Helper function to load the annotation table once in a worker process (used where workers cannot be forked, e.g. on Windows).
+def _init_annotate_worker(annotation_file, profile=False):
+    
+    global _ANNOTATION, _PROFILE
+    if profile:
+        _PROFILE = Profiler("annotate")
+    if isinstance(annotation_file, str):
+        _ANNOTATION = load_annotation(annotation_file, verbose=False)
+    else:
+        _ANNOTATION = annotation_file
+
+# Helper function to get the state (modification time) of the files an input file is annotated into, None for files that do not exist.
+def output_states(outputs):
+    
+    return {output: os.stat(output).st_mtime_ns if os.path.exists(output) else None for output in outputs}
+
+# Helper function to annotate one input file. Errors are returned instead of raised, so one file cannot stop the batch. 
+# A failed file may leave an incomplete annotated file (or sidecar) behind; only the files written for this input are removed.
+def annotate_file(a, annotation_df=None, chunksize=None, normalize=False, excel_engine="pandas", sidecar=False, output=None):
+    
+    if annotation_df is None:
+        annotation_df = _ANNOTATION
+    
+    outputs = [output or annotated_file_name(a)] + ([sidecar_file_name(a)] if sidecar and a.endswith(".xlsx") else [])
+    before = output_states(outputs)
+    
+    try:
+        nlines = check_and_skip(a)
+        file_type_handling(a=a, nlines=nlines, annotation_df=annotation_df, chunksize=chunksize, normalize=normalize, excel_engine=excel_engine, sidecar=sidecar, output=output)
+        return a, None
+    except Exception as e:
+        for file, state in output_states(outputs).items():
+            if state is not None and state != before[file]:
+                os.remove(file)
+        return a, f"{type(e).__name__}: {e}"
+
+# Helper function to annotate one input file in a worker process. The profiled stages of the file are sent back with the result (annotate --profile).
+def _annotate_file_worker(a, chunksize=None, normalize=False, excel_engine="pandas", sidecar=False):
+    
+    n_stages = len(_PROFILE.stages) if _PROFILE is not None else 0
+    a, error = annotate_file(a, chunksize=chunksize, normalize=normalize, excel_engine=excel_engine, sidecar=sidecar)
+    
+    return a, error, (_PROFILE.stages[n_stages:] if _PROFILE is not None else [])
+
+# Helper function to annotate the input files, serially or in a pool of worker processes. 
+# Gives the files that were annotated and the files that failed (with the error).
+def annotate_files(files_for_annotation, annotation_df, annotation_file, workers=1, chunksize=None, normalize=False, excel_engine="pandas", sidecar=False):
+    
+    import multiprocessing
+    from functools import partial
+    
+    global _ANNOTATION
+    
+    annotated = []
+    failed = {}
+    
+    if workers > 1 and len(files_for_annotation) > 1:
+        # Forked workers share the annotation table read-only with this process; it is never pickled per file.
+        if "fork" in multiprocessing.get_all_start_methods():
+            _ANNOTATION = annotation_df
+            pool = multiprocessing.get_context("fork").Pool(workers)
+        else:
+            worker_annotation = annotation_df if isinstance(annotation_df, AnnotationClient) else annotation_file
+            pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_annotate_worker, initargs=(worker_annotation, _PROFILE is not None))
         
-    if doc_type == "tsv":
-        ann_file.to_csv(a[:-len(doc_type)] + "ann" + f".{doc_type}", sep="\t")
-    elif doc_type == "xlsx":
-        ann_file.to_excel(a[:-len(doc_type)] + "ann" + f".{doc_type}", index=False)
-    elif doc_type == "csv":
-        ann_file.to_csv(a[:-len(doc_type)] + "ann" + f".{doc_type}")
+        print(f"Annotating {len(files_for_annotation)} files with {workers} workers...")
+        with pool:
+            results = pool.imap_unordered(partial(_annotate_file_worker, chunksize=chunksize, normalize=normalize, excel_engine=excel_engine, sidecar=sidecar), files_for_annotation)
+            for a, error, stages in results:
+                if _PROFILE is not None:
+                    _PROFILE.stages.extend(stages)
+                if error is None:
+                    print(f"Annotated file: {a}")
+                    annotated.append(a)
+                else:
+                    print(f"Failed to annotate file: {a} ({error})")
+                    failed[a] = error
+        _ANNOTATION = None
+    else:
+        for a in files_for_annotation:
+            print(f"Annotating file: {a}")
+            a, error = annotate_file(a, annotation_df, chunksize=chunksize, normalize=normalize, excel_engine=excel_engine, sidecar=sidecar)
+            if error is None:
+                annotated.append(a)
+            else:
+                print(f"Failed to annotate file: {a} ({error})")
+                failed[a] = error
+    
+    return annotated, failed
 
 # Function for annotating variants.
 def annotate(args):
     
     import os
     import glob
-    import pandas as pd
 
     os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
 
     annotation_f = args.annotation_file
     
-    annotation_df = pd.read_csv(annotation_f, sep="\t")
+    # A running annotation service (CANVAR.py serve) with the same annotation file is used instead of loading the table.
+    annotation_df = connect_annotation_service(annotation_f, args.server)
+    if annotation_df is None:
+        try:
+            with ProfileStage("load annotation") as stage:
+                annotation_df = load_annotation(annotation_f)
+                stage.rows = len(annotation_df)
+        except ValueError as e:
+            print(e)
+            exit()
+    annotation_path = os.path.abspath(annotation_f)
     
-    for f in annotation_df.Identifier.iloc[[-1]]:
-      if f != "0:000000:Valid:File":
-          print("Invalid annotation file encountered!")
-          exit()
+    if args.normalize and not isinstance(annotation_df, AnnotationClient):
+        try:
+            annotation_lookup(annotation_df, [], normalize=True)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
 
     print("Starting annotation of variants in files from ./input_files...")
     
@@ -440,16 +2217,870 @@ def annotate(args):
         print("./input_files is empty - provide files for annotation.")
         return
 
-    for a in files_for_annotation:
-        print(f"Annotating file: {a}")
-        nlines = check_and_skip(a)
+    annotated, failed = annotate_files(files_for_annotation, annotation_df, annotation_path, workers=args.workers, chunksize=args.chunksize, normalize=args.normalize,
+                                       excel_engine=args.excel_engine, sidecar=args.sidecar)
+    
+    # Only files that were annotated are moved; failed files stay in ./input_files.
+    os.chdir("..")
+    for a in annotated:
+        move_files(os.path.basename(annotated_file_name(a)))
+        if args.sidecar and a.endswith(".xlsx"):
+            move_files(os.path.basename(sidecar_file_name(a)))
+        move_files(os.path.basename(a))
+    
+    if failed:
+        print(f"{len(failed)} of {len(files_for_annotation)} files could not be annotated and were left in ./input_files:")
+        for a, error in failed.items():
+            print(f"  {a}: {error}")
+        sys.exit(1)
+
+#%% Function to watch the input files
+# "watch" keeps the annotation table loaded and annotates files as they are placed in ./input_files. 
+# New files are detected with inotify (Linux) or by polling the directory, and are annotated once their size and modification time have not changed for --settle seconds.
+# Each file goes through a journal (./.canvar_watch_journal.jsonl, one JSON record per line):
+# - started: the file is being annotated into a hidden part file (./input_files/.<name>.ann.<ext>.part), which replaces the annotated file once complete
+# - annotated: the annotated file is complete; the files are moved as by annotate (move_files). If a move fails (e.g. ./archive is missing), the file stays annotated and only the move is tried again
+# - done: both files are moved
+# - failed: the file could not be annotated and is left in ./input_files; it is annotated again when it changes
+# After a crash, started files are annotated again and annotated files are only moved, so no file is annotated twice or lost.
+
+# Class appending the states of the files to the journal of watch.
+class WatchJournal:
+    
+    def __init__(self, path):
+        self.path = path
+    
+    # Helper function to get the last record of each file in the journal.
+    def last_records(self):
+        
+        import json
+        
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # a line cut off by a crash
+                    records[record["file"]] = record
+        
+        return records
+    
+    def record(self, file, state, **info):
+        
+        import json
+        import time
+        
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"file": file, "state": state, "time": time.time(), **info}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    # Helper function to rewrite the journal with only the given records (e.g. the failed files), atomically.
+    def compact(self, records):
+        
+        import json
+        
+        with open(self.path + ".tmp", "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(self.path + ".tmp", self.path)
+
+# Class waiting for changes in a directory with inotify (Linux, through ctypes).
+class InotifyWatcher:
+    
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    
+    def __init__(self, directory):
+        
+        import ctypes
+        import ctypes.util
+        
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+    
+    # Helper function to wait until something changed in the directory or the timeout passed. The events are only used to wake up; the directory is scanned after.
+    def wait(self, timeout):
+        
+        import select
+        
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+    
+    def close(self):
+        os.close(self.fd)
+
+# Class waiting for changes in a directory by polling it.
+class PollingWatcher:
+    
+    def __init__(self, directory, interval=WATCH_INTERVAL):
+        self.interval = interval
+    
+    def wait(self, timeout):
+        
+        import time
         
-        file_type_handling(a=a, nlines=nlines, annotation_df=annotation_df)
+        time.sleep(min(timeout, self.interval))
+    
+    def close(self):
+        pass
+
+# Helper function to get the name of the hidden part file an input file is annotated into by watch.
+def part_file_name(a):
+    
+    return os.path.join(os.path.dirname(a), "." + os.path.basename(annotated_file_name(a)) + ".part")
+
+# Helper function to move an input file and its annotated file out of ./input_files, skipping files already moved. 
+# Gives whether both files have left ./input_files.
+def move_annotated(name):
+    
+    moved = True
+    for file in (os.path.basename(annotated_file_name(name)), name):
+        if os.path.exists(os.path.join(INPUT_FILES_DIRECTORY, file)):
+            moved = move_files(file) and moved
+    
+    return moved
+
+# Helper function to annotate one file of watch through the journal. 
+# Gives "done", "annotated" (the files could not be moved) or "failed".
+def watch_file(name, stat, annotation_df, journal, args):
+    
+    a = os.path.join(INPUT_FILES_DIRECTORY, name)
+    part = part_file_name(a)
+    
+    print(f"Annotating file: {name}")
+    journal.record(name, "started", size=stat.st_size, mtime=stat.st_mtime_ns)
+    a, error = annotate_file(a, annotation_df, chunksize=args.chunksize, normalize=args.normalize, excel_engine=args.excel_engine, output=part)
+    
+    if error is not None:
+        print(f"Failed to annotate file: {name} ({error})")
+        if os.path.exists(part):
+            os.remove(part)
+        journal.record(name, "failed", size=stat.st_size, mtime=stat.st_mtime_ns, error=error)
+        return "failed"
+    
+    os.replace(part, annotated_file_name(a))
+    journal.record(name, "annotated")
+    
+    return move_watched(name, journal)
+
+# Helper function to move the files of an annotated file of watch, journaling "done" only once both files have left ./input_files.
+def move_watched(name, journal):
+    
+    if not move_annotated(name):
+        print(f"Could not move the files of: {name} (the move is tried again, the file is not annotated again)")
+        return "annotated"
+    journal.record(name, "done")
+    
+    return "done"
+
+# Helper function to finish the files of a previous watch that stopped (e.g. crashed) midway. 
+# Gives the failed files, which are only annotated again when they change, and the annotated files that could not be moved.
+def resume_watch(journal):
+    
+    failed = {}
+    unmoved = {}
+    for name, record in journal.last_records().items():
+        a = os.path.join(INPUT_FILES_DIRECTORY, name)
+        if record["state"] == "started":
+            print(f"Resuming: {name} was not annotated completely and is annotated again.")
+            if os.path.exists(part_file_name(a)):
+                os.remove(part_file_name(a))
+        elif record["state"] == "annotated":
+            print(f"Resuming: {name} was annotated and is moved.")
+            if move_watched(name, journal) == "annotated":
+                unmoved[name] = record
+        elif record["state"] == "failed" and os.path.exists(a):
+            failed[name] = record
+    
+    journal.compact(list(failed.values()) + list(unmoved.values()))
+    
+    return failed, unmoved
+
+# Function to watch ./input_files and annotate new files.
+def watch(args):
+    
+    import signal
+    import time
+    
+    os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
+    
+    annotation_df = connect_annotation_service(args.annotation_file, args.server)
+    if annotation_df is None:
+        try:
+            annotation_df = load_annotation(args.annotation_file)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+    
+    if args.normalize and not isinstance(annotation_df, AnnotationClient):
+        try:
+            annotation_lookup(annotation_df, [], normalize=True)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
     
     os.chdir("..")
-    files_to_move = glob.glob(os.path.join(os.getcwd(), INPUT_FILES_DIRECTORY, "*"))
-    for move_file in files_to_move:
-        move_files(os.path.basename(move_file))
+    journal = WatchJournal(WATCH_JOURNAL)
+    failed, unmoved = resume_watch(journal)
+    
+    watcher = None
+    if not args.polling and not args.once:
+        try:
+            watcher = InotifyWatcher(INPUT_FILES_DIRECTORY)
+            print(f"Watching ./{INPUT_FILES_DIRECTORY} with inotify (stop with Ctrl+C)")
+        except (OSError, AttributeError) as e:
+            print(f"inotify not available ({e}) - polling ./{INPUT_FILES_DIRECTORY} instead.")
+    if watcher is None:
+        watcher = PollingWatcher(INPUT_FILES_DIRECTORY, args.interval)
+        if not args.once:
+            print(f"Watching ./{INPUT_FILES_DIRECTORY} every {args.interval} seconds (stop with Ctrl+C)")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Files seen and not yet annotated: (size, modification time) and since when they are unchanged.
+    pending = {}
+    moved_at = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            # Annotated files whose files could not be moved are only moved again, every --settle seconds.
+            if unmoved and now - moved_at >= args.settle:
+                moved_at = now
+                for name in list(unmoved):
+                    if move_watched(name, journal) == "done":
+                        del unmoved[name]
+            
+            names = set()
+            for entry in os.scandir(INPUT_FILES_DIRECTORY):
+                # Hidden files (e.g. part files), annotated files and files waiting to be moved are not input files.
+                if not entry.is_file() or entry.name.startswith(".") or ".ann" in entry.name or entry.name in unmoved:
+                    continue
+                stat = entry.stat()
+                names.add(entry.name)
+                if entry.name in failed and (failed[entry.name]["size"], failed[entry.name]["mtime"]) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                failed.pop(entry.name, None)
+                
+                if pending.get(entry.name, (None,))[0] != (stat.st_size, stat.st_mtime_ns):
+                    pending[entry.name] = ((stat.st_size, stat.st_mtime_ns), now)
+                elif args.once or now - pending[entry.name][1] >= args.settle:
+                    del pending[entry.name]
+                    state = watch_file(entry.name, stat, annotation_df, journal, args)
+                    if state == "failed":
+                        failed[entry.name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+                    elif state == "annotated":
+                        unmoved[entry.name] = {"file": entry.name, "state": state}
+            
+            for name in set(pending) - names:
+                del pending[name]
+            
+            if args.once and not pending:
+                break
+            watcher.wait(args.settle if pending or unmoved else 3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    
+    if args.once and unmoved:
+        print(f"{len(unmoved)} annotated files could not be moved and were left in ./input_files.")
+    if args.once and failed:
+        print(f"{len(failed)} files could not be annotated and were left in ./input_files.")
+    if args.once and (failed or unmoved):
+        sys.exit(1)
+
+#%% Function to serve the annotation table
+# The annotation service keeps the annotation table loaded and answers lookups over HTTP on localhost:
+# - GET  /status  gives the annotation file served and its number of variants
+# - POST /lookup  with {"identifiers": [...]} gives the matching rows of the annotation file ({"columns": [...], "rows": [[...], ...]})
+# - POST /reload  with {"annotation_file": "..."} loads another annotation file and swaps to it once loaded; lookups are answered from the previous table meanwhile
+
+# Class holding the annotation table of the annotation service.
+class AnnotationService:
+    
+    def __init__(self, annotation_file):
+        
+        import threading
+        
+        self.lock = threading.Lock()
+        self.annotation_file, self.annotation = self.load(annotation_file)
+    
+    # Helper function to load an annotation file (relative to ./clinvar_database_files).
+    @staticmethod
+    def load(annotation_file):
+        
+        if not os.path.exists(annotation_file) and not os.path.exists(store_path(annotation_file)):
+            raise FileNotFoundError(f"Annotation file not found: {annotation_file}")
+        
+        return os.path.basename(annotation_file), load_annotation(annotation_file)
+    
+    # Helper function to swap to another annotation file without stopping the service.
+    def reload(self, annotation_file):
+        
+        annotation_file, annotation = self.load(annotation_file)
+        with self.lock:
+            self.annotation_file, self.annotation = annotation_file, annotation
+        print(f"Annotation service swapped to: {annotation_file}")
+        
+        return self.status()
+    
+    def status(self):
+        
+        with self.lock:
+            annotation_file, annotation = self.annotation_file, self.annotation
+        
+        return {"annotation_file": annotation_file, "variants": len(annotation), "columns": ANNOTATION_COLUMNS}
+    
+    def lookup(self, identifiers, normalize=False):
+        
+        with self.lock:
+            annotation_file, annotation = self.annotation_file, self.annotation
+        
+        columns = ANNOTATION_COLUMNS + (["ClinVar_identifier"] if normalize else [])
+        table = annotation_lookup(annotation, identifiers, normalize=normalize)[columns].astype(object)
+        table = table.where(table.notna(), None)
+        
+        return {"annotation_file": annotation_file, "columns": columns, "rows": table.values.tolist()}
+
+# Class giving lookups in the annotation table of a running annotation service (used by annotate like an annotation store).
+class AnnotationClient:
+    
+    def __init__(self, url, timeout=60):
+        
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+    
+    def request(self, path, data=None, timeout=None):
+        
+        import json
+        import urllib.error
+        import urllib.request
+        
+        body = None if data is None else json.dumps(data).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise OSError(json.loads(e.read().decode("utf-8")).get("error", str(e))) from None
+    
+    def status(self, timeout=None):
+        return self.request("/status", timeout=timeout)
+    
+    def lookup(self, identifiers, normalize=False):
+        
+        import pandas as pd
+        
+        result = self.request("/lookup", {"identifiers": list(dict.fromkeys(str(x) for x in identifiers)), "normalize": normalize})
+        
+        return pd.DataFrame(result["rows"], columns=result["columns"], dtype=object)
+
+# Helper function to find a running annotation service. 
+# server is "auto" (use the service started from ./clinvar_database_files if it serves annotation_file), "off", or the URL of a service.
+def connect_annotation_service(annotation_file, server="auto"):
+    
+    import json
+    
+    if server == "off":
+        return None
+    
+    if server == "auto":
+        if not os.path.exists(SERVE_FILE):
+            return None
+        with open(SERVE_FILE) as f:
+            serve_info = json.load(f)
+        url = f"http://{serve_info['host']}:{serve_info['port']}"
+    else:
+        url = server
+    
+    client = AnnotationClient(url)
+    try:
+        status = client.status(timeout=2)
+    except OSError:
+        if server != "auto":
+            print(f"Annotation service not reachable at {url} - loading the annotation file instead.")
+        return None
+    
+    served = os.path.splitext(status["annotation_file"])[0]
+    if server == "auto" and served != os.path.splitext(os.path.basename(annotation_file))[0]:
+        print(f"Annotation service at {url} serves {status['annotation_file']} - loading {annotation_file} instead.")
+        return None
+    
+    print(f"Using annotation service at {url}: {status['annotation_file']} ({status['variants']} variants)")
+    
+    return client
+
+# Function to run the annotation service.
+def serve(args):
+    
+    import json
+    import signal
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    os.chdir(os.path.join(os.getcwd(), CLINVAR_DATABASE_DIRECTORY))
+    
+    # Ask a running service to swap to another annotation file.
+    if args.reload:
+        url = f"http://{args.host}:{args.port}"
+        if os.path.exists(SERVE_FILE):
+            with open(SERVE_FILE) as f:
+                serve_info = json.load(f)
+            url = f"http://{serve_info['host']}:{serve_info['port']}"
+        client = AnnotationClient(url)
+        try:
+            status = client.request("/reload", {"annotation_file": args.reload})
+        except OSError as e:
+            print(f"Annotation service could not be reloaded: {e}")
+            sys.exit(1)
+        print(f"Annotation service now serves: {status['annotation_file']} ({status['variants']} variants)")
+        return
+    
+    if not args.annotation_file:
+        print("Input the annotation file to serve with --annotation_file.")
+        sys.exit(1)
+    
+    try:
+        service = AnnotationService(args.annotation_file)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    
+    class Handler(BaseHTTPRequestHandler):
+        
+        def reply(self, code, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            if self.path == "/status":
+                self.reply(200, service.status())
+            else:
+                self.reply(404, {"error": f"Unknown path: {self.path}"})
+        
+        def do_POST(self):
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/lookup":
+                    self.reply(200, service.lookup(data["identifiers"], normalize=data.get("normalize", False)))
+                elif self.path == "/reload":
+                    self.reply(200, service.reload(data["annotation_file"]))
+                else:
+                    self.reply(404, {"error": f"Unknown path: {self.path}"})
+            except (KeyError, ValueError, OSError) as e:
+                self.reply(400, {"error": f"{type(e).__name__}: {e}"})
+        
+        def log_message(self, format, *args):
+            pass
+    
+    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
+    host, port = httpd.server_address[:2]
+    
+    with open(SERVE_FILE, "w") as f:
+        json.dump({"host": host, "port": port, "pid": os.getpid()}, f)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    print(f"Annotation service for {service.annotation_file} running at http://{host}:{port} (stop with Ctrl+C)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if os.path.exists(SERVE_FILE):
+            os.remove(SERVE_FILE)
+        print("Annotation service stopped.")
+
+#%% Function to query the annotation table
+# "query" finds the ClinVar variants in regions or genes through the position and gene indexes of the annotation store, reading only the entries found.
+
+# Helper function to parse a region: chr:start-end (1-based, inclusive; "," in positions allowed), chr:position or a whole chromosome.
+def parse_region(region):
+    
+    match = re.fullmatch(r"([^:\s]+)(?::([\d,]+)(?:-([\d,]+))?)?", region.strip())
+    if match is None:
+        raise ValueError(f"Invalid region: {region} - use chr:start-end (example: chr17:43044295-43125483).")
+    
+    chrom, start, end = match.groups()
+    start = int(start.replace(",", "")) if start else 1
+    end = int(end.replace(",", "")) if end else (start if match.group(2) else sys.maxsize)
+    if end < start:
+        raise ValueError(f"Invalid region: {region} - the end is before the start.")
+    
+    return chrom, start, end
+
+# Helper function to read the regions of a BED file (0-based, half-open) as 1-based, inclusive regions.
+def bed_regions(bed_file):
+    
+    regions = []
+    with open(bed_file) as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split("\t") if "\t" in line else line.split()
+            try:
+                regions.append((fields[0], int(fields[1]) + 1, int(fields[2])))
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid line {n} in {bed_file}: {line.strip()}")
+    
+    return regions
+
+# Helper function to read gene symbols: separated by "," or, from a file, one per line.
+def gene_symbols(genes):
+    
+    if os.path.isfile(genes):
+        with open(genes) as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    
+    return [gene.strip() for gene in genes.split(",") if gene.strip()]
+
+# Function to query the annotation table by region, BED file or gene.
+def query(args):
+    
+    import numpy as np
+    
+    if not (args.region or args.bed or args.gene):
+        print("Input a region (--region), a BED file (--bed) or genes (--gene) to query.")
+        sys.exit(1)
+    
+    annotation_file = os.path.join(CLINVAR_DATABASE_DIRECTORY, args.annotation_file)
+    annotation_store = open_annotation_store(annotation_file)
+    if annotation_store is None:
+        print(f"No annotation store for {args.annotation_file} - run check_construct on it to create one.")
+        sys.exit(1)
+    
+    try:
+        regions = [parse_region(region) for region in args.region or []]
+        if args.bed:
+            regions += bed_regions(args.bed)
+        genes = gene_symbols(args.gene) if args.gene else []
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    
+    with ProfileStage("query") as stage:
+        found = [annotation_store.find_region(*region) for region in regions] + [annotation_store.find_gene(gene) for gene in genes]
+        entries = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+        entries = entries[np.sort(np.unique(entries, return_index=True)[1])]
+        if args.significance:
+            entries = annotation_store.filter_entries(entries, "Clinical_significance", [s.strip() for s in args.significance.split(",")])
+        stage.rows = len(entries)
+    
+    with ProfileStage("decode", len(entries)):
+        result = annotation_store.decode(entries)
+    
+    if args.output:
+        result.to_csv(args.output, index=False, sep="\t")
+        print(f"{len(result)} ClinVar variants saved in {args.output}")
+    else:
+        tab_print(result, False)
+        print(f"\n{len(result)} ClinVar variants found.")
+
+#%% Function to benchmark CANVAR
+# The benchmark runs check_construct and annotate end to end (with --profile) on synthetic data in a temporary working environment, without network access.
+
+# Helper function to write a synthetic ClinVar database file (.vcf.gz) of n_variants variants. 
+# The INFO column has the keys and value formats of the ClinVar VCFs (CLNSIG, GENEINFO, RS, MC, CLNREVSTAT, CLNDN, ...), including variants where keys are missing.
+# Gives a sample of the variants (CHR, POS, REF, ALT) for the synthetic input files.
+def synthetic_clinvar_vcf(file, n_variants, seed=0, sample_size=100000):
+    
+    import gzip
+    import random
+    
+    rng = random.Random(seed)
+    
+    significances = ["Pathogenic", "Likely_pathogenic", "Uncertain_significance", "Benign", "Likely_benign", "Benign/Likely_benign",
+                     "Pathogenic/Likely_pathogenic", "Conflicting_interpretations_of_pathogenicity", "not_provided", "drug_response",
+                     "Uncertain_significance|risk_factor", "Pathogenic|other"]
+    genes = ["BRCA1:672", "BRCA2:675", "TP53:7157", "CFTR:1080", "MLH1:4292", "MSH2:4436", "APC:324", "ATM:472", "PALB2:79728",
+             "KRAS:3845", "EGFR:1956", "PIK3CA:5290", "TTN:7273", "RYR1:6261", "SCN5A:6331", "LDLR:3949", "GAA:2548", "LOC1:1|LOC2:2"]
+    review_status = ["criteria_provided,_single_submitter", "criteria_provided,_multiple_submitters,_no_conflicts",
+                     "criteria_provided,_conflicting_interpretations", "no_assertion_criteria_provided", "reviewed_by_expert_panel", "practice_guideline"]
+    diseases = ["not_provided", "not_specified", "Hereditary_breast_ovarian_cancer_syndrome", "Lynch_syndrome", "Cystic_fibrosis",
+                "Li-Fraumeni_syndrome|not_specified", "Familial_adenomatous_polyposis_1", "Hypercholesterolemia,_familial,_1",
+                "Inborn_genetic_diseases", "Hereditary_cancer-predisposing_syndrome|not_provided"]
+    consequences = ["SO:0001583|missense_variant", "SO:0001587|nonsense", "SO:0001589|frameshift_variant", "SO:0001819|synonymous_variant",
+                    "SO:0001627|intron_variant", "SO:0001574|splice_acceptor_variant", "SO:0001583|missense_variant,SO:0001627|intron_variant"]
+    chromosomes = [str(c) for c in range(1, 23)] + ["X", "Y", "MT"]
+    bases = "ACGT"
+    
+    sample = []
+    with gzip.open(file, "wt", compresslevel=1) as f:
+        f.write("##fileformat=VCFv4.1\n##fileDate=2023-06-17\n##source=ClinVar\n##reference=GRCh38\n")
+        f.write('##INFO=<ID=CLNSIG,Number=.,Type=String,Description="Clinical significance for this single variant">\n')
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        
+        position = 0
+        chromosome = None
+        for i in range(n_variants):
+            if chromosomes[i * len(chromosomes) // n_variants] != chromosome:
+                chromosome = chromosomes[i * len(chromosomes) // n_variants]
+                position = 10000
+            position += rng.randint(1, 400)
+            
+            r = rng.random()
+            ref = rng.choice(bases)
+            if r < 0.8:
+                alt = rng.choice(bases.replace(ref, ""))
+            elif r < 0.9:
+                alt = ref + "".join(rng.choice(bases) for _ in range(rng.randint(1, 8)))
+            else:
+                alt = ref
+                ref = ref + "".join(rng.choice(bases) for _ in range(rng.randint(1, 12)))
+            
+            info = [f"ALLELEID={rng.randint(1, 2000000)}"]
+            if rng.random() < 0.95:
+                info.append(f"CLNDISDB=MONDO:MONDO:{rng.randint(1, 9999999):07d},MedGen:C{rng.randint(1, 9999999):07d}")
+                info.append("CLNDN=" + rng.choice(diseases))
+            info.append(f"CLNHGVS=NC_0000{chromosomes.index(chromosome) + 1:02d}.11:g.{position}{ref}>{alt}")
+            if rng.random() < 0.98:
+                info.append("CLNREVSTAT=" + rng.choice(review_status))
+                info.append("CLNSIG=" + rng.choice(significances))
+            info.append("CLNVC=single_nucleotide_variant;CLNVCSO=SO:0001483")
+            if rng.random() < 0.95:
+                info.append("GENEINFO=" + rng.choice(genes))
+            if rng.random() < 0.85:
+                info.append("MC=" + rng.choice(consequences))
+            info.append("ORIGIN=1")
+            if rng.random() < 0.8:
+                info.append(f"RS={rng.randint(1, 2000000000)}")
+            
+            f.write(f"{chromosome}\t{position}\t{rng.randint(1, 3000000)}\t{ref}\t{alt}\t.\t.\t{';'.join(info)}\n")
+            
+            # Reservoir sample of the variants
+            if len(sample) < sample_size:
+                sample.append((chromosome, position, ref, alt))
+            elif rng.random() < sample_size / (i + 1):
+                sample[rng.randrange(sample_size)] = (chromosome, position, ref, alt)
+    
+    return sample
+
+# Helper function to write a synthetic input file (.tsv, .csv or .xlsx) of n_rows variants for annotate. 
+# A share of the variants (hit_rate) is taken from the synthetic ClinVar variants; the others are not in ClinVar.
+def synthetic_input_file(file, variants, n_rows, hit_rate=BENCHMARK_HIT_RATE, seed=0):
+    
+    import random
+    import pandas as pd
+    
+    rng = random.Random(seed)
+    
+    rows = []
+    for _ in range(n_rows):
+        if variants and rng.random() < hit_rate:
+            chromosome, position, ref, alt = rng.choice(variants)
+        else:
+            chromosome, position = str(rng.randint(1, 22)), rng.randint(1, 250000000)
+            ref = rng.choice("ACGT")
+            alt = rng.choice("ACGT".replace(ref, ""))
+        rows.append((f"chr{chromosome}:{position}", ref, alt, rng.choice(["het", "hom"]), rng.randint(10, 2000), round(rng.random(), 3)))
+    
+    ann_file = pd.DataFrame(rows, columns=["Locus", "Ref", "Observed Allele", "Genotype", "Coverage", "Frequency"])
+    
+    doc_type = file.split(".")[-1]
+    if doc_type == "tsv":
+        ann_file.to_csv(file, sep="\t", index=False)
+    elif doc_type == "csv":
+        ann_file.to_csv(file, sep=";", index=False)
+    elif doc_type == "xlsx":
+        ann_file.to_excel(file, index=False)
+    else:
+        raise ValueError(f"Unsupported file type: .{doc_type} (use .tsv, .csv or .xlsx)")
+
+# Helper function to run a CANVAR command with --profile in the benchmark working environment. 
+# Gives the wall time of the process and the profile report of the command.
+def benchmark_command(wrkdir, command, arguments):
+    
+    import glob
+    import json
+    import time
+    import subprocess
+    
+    for report_file in glob.glob(os.path.join(wrkdir, PROFILE_FILE.format(command=command, timestamp="*"))):
+        os.remove(report_file)
+    
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), command] + arguments + ["--profile"],
+                             cwd=wrkdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    seconds = time.perf_counter() - start
+    
+    report_files = glob.glob(os.path.join(wrkdir, PROFILE_FILE.format(command=command, timestamp="*")))
+    if process.returncode != 0 or not report_files:
+        print(process.stdout)
+        raise RuntimeError(f"Benchmark of '{command}' failed (exit code {process.returncode}).")
+    
+    with open(report_files[0]) as f:
+        report = json.load(f)
+    
+    # Stages of annotate worker processes are included in the peak memory use.
+    report["peak_rss_mb"] = max([report["peak_rss_mb"]] + [stage["peak_rss_mb"] or 0.0 for stage in report["stages"]])
+    
+    return seconds, report
+
+# Helper function to measure the startup of a CANVAR command: the median wall time of STARTUP_RUNS runs, and the imports of one run with python -X importtime. 
+# before_run is called before each run (e.g. to place an input file for annotate).
+def benchmark_startup(wrkdir, arguments, before_run=None):
+    
+    import statistics
+    import subprocess
+    import time
+    
+    command = [os.path.abspath(__file__)] + arguments
+    seconds = []
+    for n in range(STARTUP_RUNS + 1):
+        if before_run is not None:
+            before_run()
+        start = time.perf_counter()
+        if n < STARTUP_RUNS:
+            process = subprocess.run([sys.executable] + command, cwd=wrkdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            seconds.append(time.perf_counter() - start)
+        else:
+            process = subprocess.run([sys.executable, "-X", "importtime"] + command, cwd=wrkdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print(process.stdout)
+            raise RuntimeError(f"Startup benchmark of '{' '.join(arguments)}' failed (exit code {process.returncode}).")
+    
+    # Lines of -X importtime: "import time: <self us> | <cumulative us> | <module>", with nested modules indented; only the modules imported at the top level are kept.
+    imports = re.findall(r"^import time:\s+(\d+) \|\s+(\d+) \| (\S+)$", process.stderr, flags=re.MULTILINE)
+    top_imports = sorted(((module, int(cumulative) / 1e6) for _, cumulative, module in imports), key=lambda i: -i[1])[:5]
+    
+    return {"command": " ".join(arguments),
+            "seconds": round(statistics.median(seconds), 4),
+            "runs": [round(t, 4) for t in seconds],
+            "import_seconds": round(sum(int(cumulative) for _, cumulative, _ in imports) / 1e6, 4),
+            "top_imports": [[module, round(t, 4)] for module, t in top_imports]}
+
+# Function to benchmark check_construct and annotate on synthetic data.
+def benchmark(args):
+    
+    import json
+    import shutil
+    import tempfile
+    import time
+    from tabulate import tabulate
+    
+    formats = [f.strip().lstrip(".") for f in args.formats.split(",") if f.strip()]
+    for doc_type in formats:
+        if doc_type not in ("tsv", "csv", "xlsx"):
+            print(f"Unsupported file type: .{doc_type} (use .tsv, .csv or .xlsx)")
+            sys.exit(1)
+    excel_engines = [e.strip() for e in args.excel_engine.split(",") if e.strip()] or ["pandas"]
+    for engine in excel_engines:
+        if engine not in ("pandas", "stream"):
+            print(f"Unsupported Excel engine: {engine} (use pandas or stream)")
+            sys.exit(1)
+    
+    base_directory = tempfile.mkdtemp(prefix="canvar_benchmark_", dir=args.directory)
+    wrkdir = os.path.join(base_directory, WORKING_DIRECTORY)
+    for directory in ["", ARCHIVE_DIRECTORY, INPUT_FILES_DIRECTORY, OUTPUT_ANNOTATED_DIRECTORY, CLINVAR_DATABASE_DIRECTORY]:
+        os.makedirs(os.path.join(wrkdir, directory), exist_ok=True)
+    
+    results = {"variants": args.variants, "rows": args.rows, "files": args.files, "formats": formats, "seed": args.seed, "steps": []}
+    table = []
+    
+    def add_step(step, rows, seconds, report=None):
+        results["steps"].append({"step": step, "rows": rows, "seconds": round(seconds, 6), "report": report})
+        table.append([step, rows, round(seconds, 2), round(rows / seconds) if seconds > 0 else None,
+                      None if report is None else report["peak_rss_mb"]])
+    
+    try:
+        db_file = "clinvar_20230617.vcf.gz"
+        print(f"Generating synthetic ClinVar database file: {args.variants} variants...")
+        start = time.perf_counter()
+        variants = synthetic_clinvar_vcf(os.path.join(wrkdir, CLINVAR_DATABASE_DIRECTORY, db_file), args.variants, seed=args.seed)
+        add_step("generate database file", args.variants, time.perf_counter() - start)
+        
+        print("Running check_construct...")
+        construct_arguments = ["-d", db_file, "-w", str(args.workers)] + (["-s"] if args.stream else []) + (["-c", str(args.chunksize)] if args.chunksize else [])
+        seconds, report = benchmark_command(wrkdir, "check_construct", construct_arguments)
+        add_step("check_construct" + (" --stream" if args.stream else "") + (f" --workers {args.workers}" if args.workers > 1 else ""), args.variants, seconds, report)
+        
+        # Startup of --help and of annotate on one small input file, as in a per-sample run.
+        print("Measuring startup...")
+        startup_file = os.path.join(wrkdir, BENCHMARK_STARTUP_FILE)
+        synthetic_input_file(startup_file, variants, 10, hit_rate=args.hit_rate, seed=args.seed)
+        place_startup_file = lambda: shutil.copy(startup_file, os.path.join(wrkdir, INPUT_FILES_DIRECTORY))
+        results["startup"] = [benchmark_startup(wrkdir, ["--help"]),
+                              benchmark_startup(wrkdir, ["annotate", "-f", db_file[:-7] + ".tsv", "-s", "off"], before_run=place_startup_file)]
+        startup_table = []
+        for startup, budget in zip(results["startup"], STARTUP_BUDGETS.values()):
+            startup["budget"] = budget
+            startup["within_budget"] = startup["seconds"] <= budget
+            startup_table.append([startup["command"].split(" -f")[0], startup["seconds"], startup["import_seconds"], budget,
+                                  ", ".join(f"{module} ({t:.3f})" for module, t in startup["top_imports"][:3]), "ok" if startup["within_budget"] else "over budget"])
+        
+        # With --startup only the startup is measured.
+        if not args.startup:
+            print(f"Generating synthetic input files: {args.files} x {', '.join(formats)} with {args.rows} variants...")
+            input_directory = os.path.join(base_directory, INPUT_FILES_DIRECTORY)
+            os.makedirs(input_directory)
+            start = time.perf_counter()
+            for n in range(args.files):
+                for doc_type in formats:
+                    synthetic_input_file(os.path.join(input_directory, f"sample{n + 1}.{doc_type}"), variants, args.rows,
+                                         hit_rate=args.hit_rate, seed=args.seed + n)
+            add_step("generate input files", args.rows * args.files * len(formats), time.perf_counter() - start)
+            
+            # With several Excel engines, the .xlsx files are annotated once per engine, apart from the other files.
+            if "xlsx" in formats and len(excel_engines) > 1:
+                runs = [("annotate", [f for f in formats if f != "xlsx"], [])] + [(f"annotate xlsx --excel_engine {engine}", ["xlsx"], ["-e", engine]) for engine in excel_engines]
+            else:
+                runs = [("annotate", formats, ["-e", excel_engines[0]])]
+            
+            annotate_arguments = ["-f", db_file[:-7] + ".tsv", "-w", str(args.workers), "-s", "off"] + (["-c", str(args.chunksize)] if args.chunksize else [])
+            for step, run_formats, arguments in runs:
+                if not run_formats:
+                    continue
+                for n in range(args.files):
+                    for doc_type in run_formats:
+                        shutil.copy(os.path.join(input_directory, f"sample{n + 1}.{doc_type}"), os.path.join(wrkdir, INPUT_FILES_DIRECTORY))
+                print(f"Running {step}...")
+                seconds, report = benchmark_command(wrkdir, "annotate", annotate_arguments + arguments)
+                add_step(step, args.rows * args.files * len(run_formats), seconds, report)
+        
+        stage_table = []
+        for step in results["steps"]:
+            if step["report"] is not None:
+                for stage, total in step["report"]["summary"].items():
+                    stage_table.append([step["step"], stage, total["calls"], total["rows"], round(total["seconds"], 3),
+                                        None if total["rows_per_sec"] is None else round(total["rows_per_sec"]), total["peak_rss_mb"]])
+        
+        print(20 * "__")
+        print(tabulate(table, headers=["Step", "Rows", "Seconds", "Rows/sec", "Peak RSS (MB)"], tablefmt="github"))
+        print()
+        print(tabulate(stage_table, headers=["Step", "Stage", "Calls", "Rows", "Seconds", "Rows/sec", "Peak RSS (MB)"], tablefmt="github"))
+        print()
+        print(tabulate(startup_table, headers=["Startup", "Seconds", "Imports (s)", "Budget (s)", "Slowest imports (s)", "Status"], tablefmt="github"))
+        
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nBenchmark results saved as {args.output}")
+    
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    
+    finally:
+        if args.keep:
+            print(f"Benchmark working environment kept in {wrkdir}")
+        else:
+            shutil.rmtree(base_directory, ignore_errors=True)
 
 # ROLLING!
 if __name__ == "__main__":
@@ -471,18 +3102,147 @@ if __name__ == "__main__":
                                     help="Download the latest database file from ClinVar. Example: [~/CANVAR.py download_db -l latest]")
     parser_download_db.add_argument("-a", "--archive_file", metavar="", required=False,
                                     help="Input the year of which to search the ClinVar database with and choose a specific file to download. Example: [~/CANVAR.py download_db -a 2021]")
+    parser_download_db.add_argument("--assembly", choices=["37", "38"], metavar="", required=False,
+                                    help="Genome Reference Consortium Human assembly [37/38]; asked for when not given. Example: [~/CANVAR.py download_db -l latest --assembly 38]")
+    parser_download_db.add_argument("--select", metavar="", required=False,
+                                    help="Database file to download without asking: latest (the latest file, or the latest file of the year given with -a), a date (YYYYMMDD) or the index in the list of files. Example: [~/CANVAR.py download_db -l latest --assembly 38 --select latest] or [~/CANVAR.py download_db --assembly 38 --select 20230617]")
+    parser_download_db.add_argument("-r", "--refresh", action="store_true",
+                                    help=f"Revalidate the listing of ClinVar files even when the cached listing is younger than {LISTING_TTL // 3600} hours.")
+    parser_download_db.add_argument("-s", "--segments", type=int, metavar="", default=1,
+                                    help="Number of parallel segments (connections) the file is downloaded in (default: 1). Example: [~/CANVAR.py download_db -l latest -s 4]")
+    parser_download_db.add_argument("-m", "--mirror", metavar="", required=False,
+                                    help=f"Base URL of a ClinVar mirror to download from instead of {CLINVAR_URL}. Example: [~/CANVAR.py download_db -l latest -m http://mirror.example.org/clinvar/]")
     parser_download_db.set_defaults(func=download_db)
 
     parser_check_construct = subparser.add_parser("check_construct", help="Creates an annotation file with the right format needed as input for 'CANVAR.py annotate'")
     parser_check_construct.add_argument("-d", "--database_file", metavar="", required=True,
                                         help="Input the database file downloaded with 'download_db -l latest'. Takes both gz and vcf as input. Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz] or [~/CANVAR.py check_construct -d clinvar_20230923.vcf]")
+    parser_check_construct.add_argument("-s", "--stream", action="store_true",
+                                        help="Read the database file (.vcf.gz or .vcf) in chunks without decompressing it to disk. Memory use is bounded by the chunk size. Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz -s]")
+    parser_check_construct.add_argument("-c", "--chunksize", type=int, metavar="", default=None,
+                                        help=f"Number of variants per chunk when streaming (default: {CHUNKSIZE}), or per partition with --workers (default: {PARTITION_SIZE}). Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz -s -c 100000]")
+    parser_check_construct.add_argument("-w", "--workers", type=int, metavar="", default=1,
+                                        help="Number of worker processes filtering the variants in parallel (default: 1). The database file is read in chunks, as with --stream. Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz -w 8]")
+    parser_check_construct.add_argument("-p", "--previous", metavar="", required=False,
+                                        help="Input the annotation file of the previous ClinVar release. Unchanged variants are copied from it, and a changelog of added, removed and reclassified variants is written (<name>.changes.tsv). Example: [~/CANVAR.py check_construct -d clinvar_20230930.vcf.gz -p clinvar_20230923.tsv]")
+    parser_check_construct.add_argument("--no_cache", action="store_true",
+                                        help="Build the annotation file even when the database file is in the build cache, and do not add it to the cache.")
+    parser_check_construct.add_argument("--cache_size", type=float, metavar="", default=CACHE_MAX_SIZE_GB,
+                                        help=f"Maximum size of the build cache in GB; the least recently used builds are removed above it (default: {CACHE_MAX_SIZE_GB}). Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz --cache_size 5]")
+    parser_check_construct.add_argument("-P", "--profile", action="store_true",
+                                        help=f"Time each stage (wall time, rows/sec, peak memory) and save a JSON report ({PROFILE_FILE}). Example: [~/CANVAR.py check_construct -d clinvar_20230923.vcf.gz -P]")
     parser_check_construct.set_defaults(func=check_construct)
 
     parser_annotate = subparser.add_parser("annotate", help="Annotates variants - Remember to move files to be annotated (.tsv, .csv or .xlsx) to ./input_files")
     parser_annotate.add_argument("-f", "--annotation_file", metavar="", required=True,
                                  help="Input the output file from 'check_construct'. Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv]")
+    parser_annotate.add_argument("-w", "--workers", type=int, metavar="", default=1,
+                                 help="Number of files annotated in parallel (default: 1). Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -w 4]")
+    parser_annotate.add_argument("-c", "--chunksize", type=int, metavar="", default=None,
+                                 help="Annotate .tsv and .csv files in chunks of this many rows, so memory use does not grow with the file size. Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -c 100000]")
+    parser_annotate.add_argument("-s", "--server", metavar="", default="auto",
+                                 help="Use a running annotation service ('CANVAR.py serve'): auto (default; used when it serves the same annotation file), off, or the URL of the service. Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -s http://127.0.0.1:8765]")
+    parser_annotate.add_argument("-n", "--normalize", action="store_true",
+                                 help="Also match variants written differently than in ClinVar: multi-allelic ClinVar variants, and indels with other shared (trimmed) bases. The matched ClinVar identifier is added as ClinVar_identifier. Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -n]")
+    parser_annotate.add_argument("-e", "--excel_engine", choices=["pandas", "stream"], metavar="", default="pandas",
+                                 help="How .xlsx files are read and written: pandas (default; pd.read_excel/to_excel) or stream (read-only and write-only openpyxl workbooks; the same cell values, without the header formatting). Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -e stream]")
+    parser_annotate.add_argument("--sidecar", action="store_true",
+                                 help="Also save annotated .xlsx files as .tsv (sample.xlsx -> sample.ann.xlsx.tsv). Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -e stream --sidecar]")
+    parser_annotate.add_argument("-P", "--profile", action="store_true",
+                                 help=f"Time each stage (wall time, rows/sec, peak memory) and save a JSON report ({PROFILE_FILE}). Example: [~/CANVAR.py annotate -f clinvar_20230923.tsv -P]")
     parser_annotate.set_defaults(func=annotate)
 
+    parser_watch = subparser.add_parser("watch", help="Keeps the annotation table loaded and annotates files as they are placed in ./input_files")
+    parser_watch.add_argument("-f", "--annotation_file", metavar="", required=True,
+                              help="Input the output file from 'check_construct'. Example: [~/CANVAR.py watch -f clinvar_20230923.tsv]")
+    parser_watch.add_argument("-i", "--interval", type=float, metavar="", default=WATCH_INTERVAL,
+                              help=f"Seconds between scans of ./input_files when polling (default: {WATCH_INTERVAL}). Example: [~/CANVAR.py watch -f clinvar_20230923.tsv -i 10]")
+    parser_watch.add_argument("--settle", type=float, metavar="", default=WATCH_SETTLE,
+                              help=f"Seconds the size of a new file must stay the same before it is annotated (default: {WATCH_SETTLE}). Example: [~/CANVAR.py watch -f clinvar_20230923.tsv --settle 30]")
+    parser_watch.add_argument("--polling", action="store_true",
+                              help="Poll ./input_files instead of using inotify (e.g. on network drives)")
+    parser_watch.add_argument("--once", action="store_true",
+                              help="Annotate the files in ./input_files (and finish an interrupted watch) and stop. Example: [~/CANVAR.py watch -f clinvar_20230923.tsv --once]")
+    parser_watch.add_argument("-c", "--chunksize", type=int, metavar="", default=None,
+                              help="Annotate .tsv and .csv files in chunks of this many rows (see 'annotate --chunksize')")
+    parser_watch.add_argument("-n", "--normalize", action="store_true",
+                              help="Also match variants written differently than in ClinVar (see 'annotate --normalize')")
+    parser_watch.add_argument("-e", "--excel_engine", choices=["pandas", "stream"], metavar="", default="pandas",
+                              help="How .xlsx files are read and written: pandas (default) or stream (see 'annotate --excel_engine')")
+    parser_watch.add_argument("-s", "--server", metavar="", default="auto",
+                              help="Use a running annotation service ('CANVAR.py serve'): auto (default), off, or the URL of the service")
+    parser_watch.set_defaults(func=watch)
+
+    parser_cache = subparser.add_parser("cache", help="Lists or prunes the build cache of check_construct (./clinvar_database_files/.cache)")
+    parser_cache.add_argument("action", choices=["list", "prune"],
+                              help="list: show the cached builds. prune: remove the least recently used builds above --max_size. Example: [~/CANVAR.py cache list] or [~/CANVAR.py cache prune -m 5]")
+    parser_cache.add_argument("-m", "--max_size", type=float, metavar="", default=CACHE_MAX_SIZE_GB,
+                              help=f"Maximum size of the build cache in GB when pruning (default: {CACHE_MAX_SIZE_GB})")
+    parser_cache.add_argument("-a", "--all", action="store_true",
+                              help="Remove all builds when pruning")
+    parser_cache.set_defaults(func=cache)
+
+    parser_serve = subparser.add_parser("serve", help="Keeps the annotation table loaded and serves lookups on localhost for 'CANVAR.py annotate'")
+    parser_serve.add_argument("-f", "--annotation_file", metavar="", required=False,
+                              help="Input the output file from 'check_construct'. Example: [~/CANVAR.py serve -f clinvar_20230923.tsv]")
+    parser_serve.add_argument("-p", "--port", type=int, metavar="", default=SERVE_PORT,
+                              help=f"Port of the annotation service (default: {SERVE_PORT}; 0 picks a free port). Example: [~/CANVAR.py serve -f clinvar_20230923.tsv -p 8765]")
+    parser_serve.add_argument("--host", metavar="", default=SERVE_HOST,
+                              help=f"Host of the annotation service (default: {SERVE_HOST})")
+    parser_serve.add_argument("-r", "--reload", metavar="", required=False,
+                              help="Swap a running annotation service to another annotation file without stopping it. Example: [~/CANVAR.py serve -r clinvar_20231001.tsv]")
+    parser_serve.set_defaults(func=serve)
+
+    parser_query = subparser.add_parser("query", help="Finds the ClinVar variants of regions or genes in the annotation store of an annotation file")
+    parser_query.add_argument("-f", "--annotation_file", metavar="", required=True,
+                              help="Input the output file from 'check_construct'. Example: [~/CANVAR.py query -f clinvar_20230923.tsv -g BRCA1]")
+    parser_query.add_argument("-r", "--region", metavar="", action="append",
+                              help="Region as chr:start-end (1-based, inclusive), chr:position or chr; can be given more than once. Example: [~/CANVAR.py query -f clinvar_20230923.tsv -r chr17:43044295-43125483]")
+    parser_query.add_argument("-b", "--bed", metavar="", required=False,
+                              help="BED file with the regions to query (0-based, half-open as in BED files). Example: [~/CANVAR.py query -f clinvar_20230923.tsv -b panel.bed]")
+    parser_query.add_argument("-g", "--gene", metavar="", required=False,
+                              help="Gene symbols (Gene_symbol) separated by ',' or a file with one gene symbol per line. Example: [~/CANVAR.py query -f clinvar_20230923.tsv -g BRCA1,BRCA2]")
+    parser_query.add_argument("-s", "--significance", metavar="", required=False,
+                              help="Only variants with this Clinical_significance (in any case; several separated by ','). Example: [~/CANVAR.py query -f clinvar_20230923.tsv -g BRCA1 -s 'Pathogenic,Likely pathogenic']")
+    parser_query.add_argument("-o", "--output", metavar="", required=False,
+                              help="Save the variants found as a .tsv file instead of printing them. Example: [~/CANVAR.py query -f clinvar_20230923.tsv -b panel.bed -o panel_clinvar.tsv]")
+    parser_query.add_argument("-P", "--profile", action="store_true",
+                              help=f"Time each stage (wall time, rows/sec, peak memory) and save a JSON report ({PROFILE_FILE}). Example: [~/CANVAR.py query -f clinvar_20230923.tsv -g BRCA1 -P]")
+    parser_query.set_defaults(func=query)
+
+    parser_benchmark = subparser.add_parser("benchmark", help="Benchmarks check_construct and annotate on synthetic ClinVar and input files (no network access needed)")
+    parser_benchmark.add_argument("-n", "--variants", type=int, metavar="", default=BENCHMARK_VARIANTS,
+                                  help=f"Number of variants of the synthetic ClinVar database file (default: {BENCHMARK_VARIANTS}). Example: [~/CANVAR.py benchmark -n 1000000]")
+    parser_benchmark.add_argument("-r", "--rows", type=int, metavar="", default=BENCHMARK_ROWS,
+                                  help=f"Number of variants per synthetic input file (default: {BENCHMARK_ROWS}). Example: [~/CANVAR.py benchmark -r 50000]")
+    parser_benchmark.add_argument("--files", type=int, metavar="", default=1,
+                                  help="Number of synthetic input files per file type (default: 1)")
+    parser_benchmark.add_argument("--formats", metavar="", default=BENCHMARK_FORMATS,
+                                  help=f"File types of the synthetic input files (default: {BENCHMARK_FORMATS}). Example: [~/CANVAR.py benchmark --formats tsv,csv]")
+    parser_benchmark.add_argument("--hit_rate", type=float, metavar="", default=BENCHMARK_HIT_RATE,
+                                  help=f"Share of the input variants that are in the synthetic ClinVar database file (default: {BENCHMARK_HIT_RATE})")
+    parser_benchmark.add_argument("-e", "--excel_engine", metavar="", default=BENCHMARK_EXCEL_ENGINES,
+                                  help=f"Excel engines of annotate --excel_engine to compare on the .xlsx files (default: {BENCHMARK_EXCEL_ENGINES}). Example: [~/CANVAR.py benchmark --formats xlsx -e pandas,stream]")
+    parser_benchmark.add_argument("-s", "--stream", action="store_true",
+                                  help="Run check_construct with --stream")
+    parser_benchmark.add_argument("-c", "--chunksize", type=int, metavar="", default=None,
+                                  help="Chunk size passed to check_construct --chunksize and annotate --chunksize")
+    parser_benchmark.add_argument("-w", "--workers", type=int, metavar="", default=1,
+                                  help="Workers passed to check_construct --workers and annotate --workers (default: 1)")
+    parser_benchmark.add_argument("--startup", action="store_true",
+                                  help=f"Only measure the startup of --help and of annotate on one small input file (median of {STARTUP_RUNS} runs, imports with python -X importtime), against the budgets {', '.join(f'{c}: {b} s' for c, b in STARTUP_BUDGETS.items())}. Example: [~/CANVAR.py benchmark -n 10000 --startup]")
+    parser_benchmark.add_argument("--seed", type=int, metavar="", default=0,
+                                  help="Seed of the synthetic data (default: 0)")
+    parser_benchmark.add_argument("-d", "--directory", metavar="", default=None,
+                                  help="Directory of the temporary benchmark working environment (default: the system temporary directory)")
+    parser_benchmark.add_argument("-k", "--keep", action="store_true",
+                                  help="Keep the benchmark working environment")
+    parser_benchmark.add_argument("-o", "--output", metavar="", default=None,
+                                  help="Save the results, including the profile reports, as JSON. Example: [~/CANVAR.py benchmark -o benchmark.json]")
+    parser_benchmark.set_defaults(func=benchmark)
+
     args = parser.parse_args()
-    if args.func:
+    if getattr(args, "profile", False):
+        run_profiled(args)
+    elif args.func:
         args.func(args)
@@ -0,0 +1,293 @@
+# Tests of the resumable downloads and listing index of download_db against a local stand-in for the ClinVar FTP.
+# Run from the repository directory: python -m pytest tests (or python -m unittest discover tests)
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CANVAR
+
+FILE_NAME = "clinvar_20230617.vcf.gz"
+FILE_DATA = os.urandom(3 * CANVAR.DOWNLOAD_BLOCK + 12345)
+
+# Class serving a ClinVar directory listing, a database file and its .md5 checksum.
+# The attributes switch the behaviour tested: a wrong checksum, no Range support, a changed file (ETag) and dropped connections.
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def listing(self):
+
+        lines = ["<html><body><pre>", '<a href="/pub/">Parent Directory</a>',
+                 f'<a href="{FILE_NAME}">{FILE_NAME}</a>                          2023-06-17 10:24   {len(FILE_DATA) // 1000}K',
+                 f'<a href="{FILE_NAME}.md5">{FILE_NAME}.md5</a>                          2023-06-17 10:24   58',
+                 "<hr></pre></body></html>"]
+
+        return "\n".join(lines).encode()
+
+    def send_body(self, status, data, headers=(), body=True):
+
+        self.send_response(status)
+        for header in headers:
+            self.send_header(*header)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.answer(body=False)
+
+    def do_GET(self):
+        self.answer(body=True)
+
+    def answer(self, body):
+
+        server = self.server
+        server.requests.append((self.command, self.path, dict(self.headers)))
+
+        if self.path == "/pub/clinvar/vcf_GRCh38/":
+            etag = '"listing-1"'
+            if self.headers.get("If-None-Match") == etag:
+                server.statuses.append(304)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            server.statuses.append(200)
+            self.send_body(200, self.listing(), [("ETag", etag)], body)
+        elif self.path == f"/pub/clinvar/vcf_GRCh38/{FILE_NAME}.md5":
+            checksum = "0" * 32 if server.bad_md5 else hashlib.md5(FILE_DATA).hexdigest()
+            self.send_body(200, f"{checksum}  {FILE_NAME}\n".encode(), body=body)
+        elif self.path == f"/pub/clinvar/vcf_GRCh38/{FILE_NAME}":
+            self.answer_file(body)
+        else:
+            self.send_body(404, b"", body=body)
+
+    def answer_file(self, body):
+
+        server = self.server
+        headers = [("ETag", server.etag)]
+        if not server.no_range:
+            headers.append(("Accept-Ranges", "bytes"))
+
+        start, end, status = 0, len(FILE_DATA), 200
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and not server.no_range and self.headers.get("If-Range") in (None, server.etag):
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(FILE_DATA)
+            status = 206
+            headers.append(("Content-Range", f"bytes {start}-{end - 1}/{len(FILE_DATA)}"))
+        data = FILE_DATA[start:end]
+
+        if not body or server.drops == 0:
+            self.send_body(status, data, headers, body)
+            return
+
+        # Drop the connection after part of the body.
+        server.drops -= 1
+        self.send_response(status)
+        for header in headers:
+            self.send_header(*header)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data[:server.drop_after])
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class StandInTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.bad_md5 = False
+        self.server.no_range = False
+        self.server.etag = '"file-1"'
+        self.server.drops = 0
+        self.server.drop_after = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}/pub/clinvar/vcf_GRCh38/"
+        self.url = self.base + FILE_NAME
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+        # Retries after a dropped connection without waiting.
+        self.sleep = mock.patch("time.sleep")
+        self.sleep.start()
+
+    def tearDown(self):
+
+        self.sleep.stop()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def file_requests(self, command="GET"):
+        return [headers for method, path, headers in self.server.requests if method == command and path.endswith(FILE_NAME)]
+
+    def read(self, file):
+        with open(file, "rb") as f:
+            return f.read()
+
+
+class DownloadFileTest(StandInTest):
+
+    def test_download_segments(self):
+
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME, segments=3))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        self.assertEqual(len(self.file_requests()), 3)
+        self.assertFalse(os.path.exists(FILE_NAME + ".part"))
+        self.assertFalse(os.path.exists(FILE_NAME + ".part.json"))
+
+    def test_dropped_connection_is_retried(self):
+
+        self.server.drops = 1
+        self.server.drop_after = CANVAR.DOWNLOAD_BLOCK + 1000
+
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        first, retry = self.file_requests()
+        self.assertEqual(first["Range"], f"bytes=0-{len(FILE_DATA) - 1}")
+        self.assertNotEqual(retry["Range"], first["Range"])
+        self.assertEqual(retry["If-Range"], self.server.etag)
+
+    def test_resume_from_part_state(self):
+
+        self.server.drops = 1
+        self.server.drop_after = 2 * CANVAR.DOWNLOAD_BLOCK + 1000
+        with mock.patch.object(CANVAR, "DOWNLOAD_RETRIES", 0):
+            with self.assertRaises(Exception):
+                CANVAR.download_file(self.url, FILE_NAME)
+
+        self.assertFalse(os.path.exists(FILE_NAME))
+        with open(FILE_NAME + ".part.json") as f:
+            state = json.load(f)
+        position = state["segments"][0][1]
+        self.assertGreater(position, 0)
+
+        self.server.requests.clear()
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        (resumed,) = self.file_requests()
+        self.assertEqual(resumed["Range"], f"bytes={position}-{len(FILE_DATA) - 1}")
+        self.assertEqual(resumed["If-Range"], self.server.etag)
+        self.assertFalse(os.path.exists(FILE_NAME + ".part.json"))
+
+    def test_changed_file_is_not_resumed(self):
+
+        self.server.drops = 1
+        self.server.drop_after = 2 * CANVAR.DOWNLOAD_BLOCK + 1000
+        with mock.patch.object(CANVAR, "DOWNLOAD_RETRIES", 0):
+            with self.assertRaises(Exception):
+                CANVAR.download_file(self.url, FILE_NAME)
+
+        self.server.etag = '"file-2"'
+        self.server.requests.clear()
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        (restarted,) = self.file_requests()
+        self.assertEqual(restarted["Range"], f"bytes=0-{len(FILE_DATA) - 1}")
+
+    def test_no_range_support(self):
+
+        self.server.no_range = True
+
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME, segments=4))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        (single,) = self.file_requests()
+        self.assertNotIn("If-Range", single)
+        self.assertFalse(os.path.exists(FILE_NAME + ".part.json"))
+
+    def test_no_range_dropped_connection_restarts(self):
+
+        self.server.no_range = True
+        self.server.drops = 1
+        self.server.drop_after = CANVAR.DOWNLOAD_BLOCK + 1000
+
+        self.assertTrue(CANVAR.download_file(self.url, FILE_NAME))
+
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+        self.assertEqual(len(self.file_requests()), 2)
+
+    def test_md5_mismatch_removes_download(self):
+
+        self.server.bad_md5 = True
+
+        with self.assertRaises(ValueError):
+            CANVAR.download_file(self.url, FILE_NAME)
+
+        self.assertFalse(os.path.exists(FILE_NAME))
+        self.assertFalse(os.path.exists(FILE_NAME + ".part"))
+        self.assertFalse(os.path.exists(FILE_NAME + ".part.json"))
+
+    def test_verified_file_is_skipped(self):
+
+        with open(FILE_NAME, "wb") as f:
+            f.write(FILE_DATA)
+
+        self.assertFalse(CANVAR.download_file(self.url, FILE_NAME))
+
+        self.assertEqual(self.file_requests(), [])
+        self.assertEqual(self.read(FILE_NAME), FILE_DATA)
+
+
+class ClinvarListingTest(StandInTest):
+
+    def test_listing_is_parsed(self):
+
+        files = CANVAR.clinvar_listing(CANVAR.download_session(), self.base)
+
+        self.assertEqual(files["Name"].tolist(), [FILE_NAME])
+        self.assertEqual(files["Date"].str.strip().tolist(), ["2023-06-17 10:24"])
+
+    def test_listing_index_within_ttl(self):
+
+        session = CANVAR.download_session()
+        first = CANVAR.clinvar_listing(session, self.base)
+        second = CANVAR.clinvar_listing(session, self.base)
+
+        self.assertEqual(self.server.statuses, [200])
+        self.assertTrue(first.equals(second))
+
+    def test_listing_revalidated_with_etag(self):
+
+        session = CANVAR.download_session()
+        first = CANVAR.clinvar_listing(session, self.base)
+        second = CANVAR.clinvar_listing(session, self.base, refresh=True)
+
+        self.assertEqual(self.server.statuses, [200, 304])
+        revalidation = self.server.requests[-1][2]
+        self.assertEqual(revalidation["If-None-Match"], '"listing-1"')
+        self.assertTrue(first.equals(second))
+        with open(CANVAR.LISTING_INDEX) as f:
+            self.assertEqual(json.load(f)[self.base]["files"], first.values.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
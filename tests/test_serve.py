@@ -0,0 +1,190 @@
+# Tests of the annotation service (CANVAR.py serve) and its use by annotate, on localhost.
+# Run from the repository directory: python -m pytest tests (or python -m unittest discover tests)
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from workspace import CANVAR, CANVAR_PY, make_workspace, read_files, run_canvar, write_input_file
+
+ANNOTATION = CANVAR.CLINVAR_DATABASE_DIRECTORY
+
+
+class ServeTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.workspace = self.directory.name
+        make_workspace(self.workspace)
+        self.service = None
+
+    def tearDown(self):
+
+        if self.service is not None:
+            self.service.terminate()
+            self.service.wait(timeout=30)
+        self.directory.cleanup()
+
+    # Helper function to start the annotation service on a free port (port 0) and wait until it answers.
+    def start_service(self, annotation_file):
+
+        serve_file = os.path.join(self.workspace, ANNOTATION, CANVAR.SERVE_FILE)
+        self.service = subprocess.Popen([sys.executable, CANVAR_PY, "serve", "-f", annotation_file, "-p", "0"], cwd=self.workspace,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(300):
+            if os.path.exists(serve_file):
+                try:
+                    with open(serve_file) as f:
+                        serve_info = json.load(f)
+                    self.url = f"http://{serve_info['host']}:{serve_info['port']}"
+                    self.request("/status")
+                    return
+                except (ValueError, OSError):
+                    pass
+            self.assertIsNone(self.service.poll(), "serve stopped")
+            time.sleep(0.1)
+        self.fail("serve did not start")
+
+    def request(self, path, data=None):
+
+        body = None if data is None else json.dumps(data).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    # Helper function to annotate the same input files with annotate. Gives the annotated files and the output of annotate.
+    def annotate(self, annotation_file, *args):
+
+        for d in (CANVAR.OUTPUT_ANNOTATED_DIRECTORY, CANVAR.ARCHIVE_DIRECTORY):
+            shutil.rmtree(os.path.join(self.workspace, d))
+            os.mkdir(os.path.join(self.workspace, d))
+        write_input_file(os.path.join(self.workspace, CANVAR.INPUT_FILES_DIRECTORY, "s1.tsv"))
+        write_input_file(os.path.join(self.workspace, CANVAR.INPUT_FILES_DIRECTORY, "s2.tsv"), offset=20)
+
+        result = run_canvar(self.workspace, "annotate", "-f", annotation_file, *args)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        annotated = read_files(self.workspace, CANVAR.OUTPUT_ANNOTATED_DIRECTORY)
+        self.assertEqual(sorted(annotated), ["s1.ann.tsv", "s2.ann.tsv"])
+
+        return annotated, result.stdout
+
+    def test_status(self):
+
+        self.start_service("a.tsv")
+
+        status = self.request("/status")
+
+        self.assertEqual(status["annotation_file"], "a.tsv")
+        self.assertEqual(status["variants"], 42)
+        self.assertEqual(status["columns"], CANVAR.ANNOTATION_COLUMNS)
+
+    def test_lookup(self):
+
+        self.start_service("a.tsv")
+
+        result = self.request("/lookup", {"identifiers": ["1:1000:A:G", "2:1010:A:G", "5:5000:C:T"]})
+
+        self.assertEqual(result["columns"], CANVAR.ANNOTATION_COLUMNS)
+        rows = {row[0]: row for row in result["rows"]}
+        self.assertEqual(sorted(rows), ["1:1000:A:G", "2:1010:A:G"])
+        self.assertEqual(rows["1:1000:A:G"][1:4], ["BRCA1", "Pathogenic", "RS100"])
+        self.assertEqual(rows["2:1010:A:G"][1:4], ["BRCA2", "Benign", "RS101"])
+
+    def test_lookup_normalize(self):
+
+        self.start_service("a.tsv")
+
+        exact = self.request("/lookup", {"identifiers": ["1:101:A:-", "2:200:A:T"]})
+        normalized = self.request("/lookup", {"identifiers": ["1:101:A:-", "2:200:A:T"], "normalize": True})
+
+        self.assertEqual(exact["rows"], [])
+        self.assertEqual(normalized["columns"], CANVAR.ANNOTATION_COLUMNS + ["ClinVar_identifier"])
+        matches = {row[0]: row[-1] for row in normalized["rows"]}
+        self.assertEqual(matches, {"1:101:A:-": "1:100:GA:G", "2:200:A:T": "2:200:A:C,T"})
+
+    def test_reload(self):
+
+        self.start_service("a.tsv")
+
+        status = self.request("/reload", {"annotation_file": "b.tsv"})
+        result = self.request("/lookup", {"identifiers": ["1:1000:A:G"]})
+
+        self.assertEqual(status["annotation_file"], "b.tsv")
+        self.assertEqual(self.request("/status")["annotation_file"], "b.tsv")
+        self.assertEqual(result["annotation_file"], "b.tsv")
+        self.assertEqual(result["rows"][0][2], "Benign")
+
+    def test_reload_missing_file_keeps_serving(self):
+
+        self.start_service("a.tsv")
+
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.request("/reload", {"annotation_file": "missing.tsv"})
+
+        self.assertEqual(error.exception.code, 400)
+        self.assertEqual(self.request("/status")["annotation_file"], "a.tsv")
+
+    def test_reload_command(self):
+
+        self.start_service("a.tsv")
+
+        result = run_canvar(self.workspace, "serve", "-r", "b.tsv")
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertEqual(self.request("/status")["annotation_file"], "b.tsv")
+
+    def test_annotate_with_service(self):
+
+        local, _ = self.annotate("a.tsv", "-s", "off")
+        local_normalized, _ = self.annotate("a.tsv", "-s", "off", "-n")
+        self.start_service("a.tsv")
+
+        served, output = self.annotate("a.tsv", "-s", "auto")
+        served_normalized, _ = self.annotate("a.tsv", "-s", self.url, "-n")
+
+        self.assertIn(f"Using annotation service at {self.url}", output)
+        self.assertEqual(served, local)
+        self.assertEqual(served_normalized, local_normalized)
+        self.assertNotEqual(local_normalized, local)
+
+    def test_annotate_after_reload(self):
+
+        local, _ = self.annotate("b.tsv", "-s", "off")
+        self.start_service("a.tsv")
+        self.request("/reload", {"annotation_file": "b.tsv"})
+
+        served, output = self.annotate("b.tsv", "-s", "auto")
+
+        self.assertIn("Using annotation service", output)
+        self.assertEqual(served, local)
+
+    def test_annotate_falls_back_for_another_file(self):
+
+        local, _ = self.annotate("a.tsv", "-s", "off")
+        self.start_service("b.tsv")
+
+        fallback, output = self.annotate("a.tsv", "-s", "auto")
+
+        self.assertIn("serves b.tsv - loading a.tsv instead", output)
+        self.assertNotIn("Using annotation service", output)
+        self.assertEqual(fallback, local)
+
+    def test_annotate_without_service(self):
+
+        local, _ = self.annotate("a.tsv", "-s", "off")
+
+        fallback, output = self.annotate("a.tsv", "-s", "http://127.0.0.1:1")
+
+        self.assertIn("not reachable", output)
+        self.assertEqual(fallback, local)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+# Tests of the journal of watch: each state a previous watch can stop in is finished by watch --once, without annotating a file twice or losing it.
+# Run from the repository directory: python -m pytest tests (or python -m unittest discover tests)
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from workspace import CANVAR, make_workspace, read_files, run_canvar, write_input_file
+
+INPUT = CANVAR.INPUT_FILES_DIRECTORY
+OUTPUT = CANVAR.OUTPUT_ANNOTATED_DIRECTORY
+ARCHIVE = CANVAR.ARCHIVE_DIRECTORY
+
+
+class WatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        # The annotated file of s1.tsv as annotate writes it.
+        with tempfile.TemporaryDirectory() as directory:
+            make_workspace(directory)
+            write_input_file(os.path.join(directory, INPUT, "s1.tsv"))
+            result = run_canvar(directory, "annotate", "-f", "a.tsv", "-s", "off")
+            assert result.returncode == 0, result.stdout + result.stderr
+            cls.reference = read_files(directory, OUTPUT)["s1.ann.tsv"]
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.workspace = self.directory.name
+        make_workspace(self.workspace)
+        self.journal = os.path.join(self.workspace, CANVAR.WATCH_JOURNAL)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.workspace, *names)
+
+    def write(self, file, content):
+        with open(self.path(*file), "w") as f:
+            f.write(content)
+
+    def seed_journal(self, *records, cut_off=False):
+
+        with open(self.journal, "a") as f:
+            for n, (file, state, info) in enumerate(records):
+                f.write(json.dumps({"file": file, "state": state, "time": n, **info}) + "\n")
+            if cut_off:
+                f.write('{"file": "s9.tsv", "sta')
+
+    def last_states(self):
+
+        states = {}
+        with open(self.journal) as f:
+            for line in f:
+                record = json.loads(line)
+                states[record["file"]] = record["state"]
+
+        return states
+
+    def watch(self):
+        return run_canvar(self.workspace, "watch", "-f", "a.tsv", "-s", "off", "--once")
+
+    def test_new_file(self):
+
+        write_input_file(self.path(INPUT, "s1.tsv"))
+
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertEqual(result.stdout.count("Annotating file: s1.tsv"), 1)
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"s1.ann.tsv": self.reference})
+        self.assertEqual(list(read_files(self.workspace, ARCHIVE)), ["s1.tsv"])
+        self.assertEqual(os.listdir(self.path(INPUT)), [])
+        self.assertEqual(self.last_states(), {"s1.tsv": "done"})
+
+    def test_started_file_is_annotated_again(self):
+
+        write_input_file(self.path(INPUT, "s1.tsv"))
+        self.write((INPUT, ".s1.ann.tsv.part"), "incomplete")
+        self.seed_journal(("s1.tsv", "started", {"size": 1, "mtime": 1}), cut_off=True)
+
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("Resuming: s1.tsv was not annotated completely", result.stdout)
+        self.assertEqual(result.stdout.count("Annotating file: s1.tsv"), 1)
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"s1.ann.tsv": self.reference})
+        self.assertEqual(list(read_files(self.workspace, ARCHIVE)), ["s1.tsv"])
+        self.assertEqual(os.listdir(self.path(INPUT)), [])
+
+    def test_annotated_file_is_only_moved(self):
+
+        write_input_file(self.path(INPUT, "s1.tsv"))
+        self.write((INPUT, "s1.ann.tsv"), "annotated before the crash")
+        self.seed_journal(("s1.tsv", "started", {"size": 1, "mtime": 1}), ("s1.tsv", "annotated", {}), cut_off=True)
+
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertNotIn("Annotating file", result.stdout)
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"s1.ann.tsv": b"annotated before the crash"})
+        self.assertEqual(list(read_files(self.workspace, ARCHIVE)), ["s1.tsv"])
+        self.assertEqual(os.listdir(self.path(INPUT)), [])
+        # Finished files are dropped from the journal when it is compacted on resuming.
+        self.assertEqual(self.last_states(), {})
+
+    def test_annotated_file_moved_before_the_crash(self):
+
+        write_input_file(self.path(ARCHIVE, "s1.tsv"))
+        self.write((OUTPUT, "s1.ann.tsv"), "annotated before the crash")
+        self.seed_journal(("s1.tsv", "annotated", {}))
+
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertNotIn("Annotating file", result.stdout)
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"s1.ann.tsv": b"annotated before the crash"})
+        self.assertEqual(self.last_states(), {})
+
+    def test_failed_file_is_skipped_until_changed(self):
+
+        self.write((INPUT, "bad.tsv"), "foo\tbar\n1\t2\n")
+        stat = os.stat(self.path(INPUT, "bad.tsv"))
+        self.seed_journal(("bad.tsv", "failed", {"size": stat.st_size, "mtime": stat.st_mtime_ns, "error": "KeyError: 'Locus'"}))
+
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 1)
+        self.assertNotIn("Annotating file", result.stdout)
+        self.assertEqual(os.listdir(self.path(INPUT)), ["bad.tsv"])
+        self.assertEqual(self.last_states(), {"bad.tsv": "failed"})
+
+        write_input_file(self.path(INPUT, "bad.tsv"))
+        result = self.watch()
+
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertEqual(result.stdout.count("Annotating file: bad.tsv"), 1)
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"bad.ann.tsv": self.reference})
+        self.assertEqual(self.last_states(), {"bad.tsv": "done"})
+
+    def test_failing_file_is_journaled_once(self):
+
+        self.write((INPUT, "bad.tsv"), "foo\tbar\n1\t2\n")
+
+        first = self.watch()
+        second = self.watch()
+
+        self.assertEqual((first.returncode, second.returncode), (1, 1))
+        self.assertEqual(first.stdout.count("Annotating file: bad.tsv"), 1)
+        self.assertNotIn("Annotating file", second.stdout)
+        self.assertEqual(os.listdir(self.path(INPUT)), ["bad.tsv"])
+        self.assertEqual(read_files(self.workspace, OUTPUT), {})
+
+    def test_unmoved_file_is_only_moved_again(self):
+
+        write_input_file(self.path(INPUT, "s1.tsv"))
+        shutil.rmtree(self.path(ARCHIVE))
+
+        first = self.watch()
+
+        self.assertEqual(first.returncode, 1)
+        self.assertEqual(first.stdout.count("Annotating file: s1.tsv"), 1)
+        self.assertEqual(sorted(os.listdir(self.path(INPUT))), ["s1.tsv"])
+        self.assertEqual(read_files(self.workspace, OUTPUT), {"s1.ann.tsv": self.reference})
+        self.assertEqual(self.last_states(), {"s1.tsv": "annotated"})
+
+        os.mkdir(self.path(ARCHIVE))
+        second = self.watch()
+
+        self.assertEqual(second.returncode, 0, second.stdout + second.stderr)
+        self.assertNotIn("Annotating file", second.stdout)
+        self.assertIn("Resuming: s1.tsv was annotated and is moved.", second.stdout)
+        self.assertEqual(list(read_files(self.workspace, ARCHIVE)), ["s1.tsv"])
+        self.assertEqual(os.listdir(self.path(INPUT)), [])
+        self.assertEqual(self.last_states(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
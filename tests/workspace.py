@@ -0,0 +1,64 @@
+# Helpers creating a CANVAR working environment with small annotation and input files for the tests, and running CANVAR.py in it.
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CANVAR
+
+CANVAR_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CANVAR.py")
+
+GENES = ["BRCA1", "BRCA2", "TP53", "CFTR", "PRSS1"]
+SIGNIFICANCE = ["Pathogenic", "Benign", "Likely_benign", "Uncertain_significance"]
+
+# Helper function to write an annotation file (as written by check_construct) with n variants, and create its annotation store.
+# shift changes the Clinical_significance of every variant, so two annotation files can be told apart.
+# Besides the SNVs, it holds a deletion (1:100:GA:G) and a multi-allelic variant (2:200:A:C,T) for annotate --normalize.
+def write_annotation_file(path, n=40, shift=0, store=True):
+
+    rows = ["\t".join(CANVAR.ANNOTATION_COLUMNS)]
+    variants = [f"{1 + i % 3}:{1000 + 10 * i}:A:G" for i in range(n)] + ["1:100:GA:G", "2:200:A:C,T"]
+    for i, identifier in enumerate(variants):
+        rows.append("\t".join([identifier, GENES[i % len(GENES)], SIGNIFICANCE[(i + shift) % len(SIGNIFICANCE)],
+                               f"RS{100 + i}", "missense_variant", "criteria_provided,_single_submitter", "not_provided"]))
+    rows.append(CANVAR.VALID_FILE_IDENTIFIER + 6 * "\t")
+    with open(path, "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+    if store:
+        CANVAR.build_annotation_store(path)
+
+# Helper function to write an input file: variants in the annotation file, variants not in it, and the deletion and multi-allelic variant written differently.
+def write_input_file(path, n=12, offset=0):
+
+    rows = ["Locus\tRef\tObserved Allele\tDepth"]
+    for i in range(offset, offset + n):
+        rows.append(f"chr{1 + i % 3}:{1000 + 10 * i}\tA\tG\t{50 + i}")
+    rows.append("chr5:5000\tC\tT\t33")
+    rows.append("chr1:101\tA\t-\t40")
+    rows.append("chr2:200\tA\tT\t41")
+    with open(path, "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+# Helper function to create the working environment (as created by prearrange) in directory, with the annotation files a.tsv and b.tsv.
+def make_workspace(directory):
+
+    for d in (CANVAR.CLINVAR_DATABASE_DIRECTORY, CANVAR.INPUT_FILES_DIRECTORY, CANVAR.OUTPUT_ANNOTATED_DIRECTORY, CANVAR.ARCHIVE_DIRECTORY):
+        os.makedirs(os.path.join(directory, d), exist_ok=True)
+    write_annotation_file(os.path.join(directory, CANVAR.CLINVAR_DATABASE_DIRECTORY, "a.tsv"))
+    write_annotation_file(os.path.join(directory, CANVAR.CLINVAR_DATABASE_DIRECTORY, "b.tsv"), shift=1)
+
+# Helper function to run CANVAR.py in a working environment. Gives the completed process (with its output as text).
+def run_canvar(directory, *args, timeout=120):
+
+    return subprocess.run([sys.executable, CANVAR_PY, *args], cwd=directory, capture_output=True, text=True, timeout=timeout)
+
+# Helper function to read the files of a directory of a working environment (name -> content).
+def read_files(directory, subdirectory):
+
+    files = {}
+    for name in sorted(os.listdir(os.path.join(directory, subdirectory))):
+        with open(os.path.join(directory, subdirectory, name), "rb") as f:
+            files[name] = f.read()
+
+    return files